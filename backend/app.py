@@ -1,18 +1,49 @@
-from flask import Flask, request, jsonify, send_file, make_response
+from flask import Flask, Request, request, jsonify, send_file, make_response, stream_with_context
 from flask_cors import CORS
+from flask.json.provider import DefaultJSONProvider
 import sqlite3
 import os
 import datetime
 import time
 import threading
-from werkzeug.utils import secure_filename
+import collections
+import queue
+import sched
+import atexit
+import hashlib
+import gzip
+import tempfile
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import RequestEntityTooLarge
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import math
+import orjson
 from datetime import datetime, timedelta
 
 
+# Types orjson can't encode natively, and datetimes, fall back to Flask's
+# own encoding so responses look the same as with the stdlib encoder
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider for jsonify and request.json backed by orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS), mimetype=self.mimetype
+        )
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app, resources={
     r"/*": {
         "origins": "*",
@@ -26,44 +57,408 @@ CORS(app, resources={
 
 # Setup logging
 log_file = os.path.join(os.path.dirname(__file__), 'app.log')
-handler = RotatingFileHandler(log_file, maxBytes=10000, backupCount=1)
+handler = RotatingFileHandler(log_file, maxBytes=1024 * 1024, backupCount=1)
 handler.setLevel(logging.INFO)
-app.logger.addHandler(handler)
-app.logger.setLevel(logging.INFO)
+# Request threads only enqueue records, a listener thread does the file writes and
+# rotation. Records are written as they arrive so a killed process loses none.
+log_queue = queue.Queue(-1)
+app.logger.addHandler(QueueHandler(log_queue))
+log_listener = QueueListener(log_queue, handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+# LOG_LEVEL=DEBUG brings back the per-reading automation trace
+app.logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
 
-# Add OPTIONS handler for preflight requests
-@app.after_request
-def after_request(response):
+# Preflight answer shared by every route. Browsers cache it for a day.
+PREFLIGHT_HEADERS = (
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Headers', 'Content-Type,Authorization,Accept'),
+    ('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS'),
+    ('Access-Control-Max-Age', '86400'),
+)
+
+# Answer OPTIONS preflight requests before routing to a view
+@app.before_request
+def answer_preflight():
     if request.method == 'OPTIONS':
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Accept')
-        response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-        response.headers.add('Access-Control-Max-Age', '86400')
+        return app.response_class(status=204, headers=PREFLIGHT_HEADERS)
+
+# JSON bodies smaller than this are sent as is, gzip would barely shrink them
+GZIP_MIN_SIZE = 1024
+# Level 5 gets most of level 9's ratio on JSON for a fraction of the CPU
+GZIP_LEVEL = 5
+
+@app.after_request
+def gzip_json_response(response):
+    """Gzip buffered JSON responses for clients that accept it."""
+    response.vary.add('Accept-Encoding')
+    if (response.mimetype != 'application/json'
+            or response.is_streamed
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.accept_encodings):
+        return response
+    
+    body = response.get_data()
+    if len(body) < GZIP_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
     return response
 
+# Rows encoded per chunk when streaming query results
+STREAM_BATCH_SIZE = 500
+
+def stream_json_rows(cursor):
+    """Stream a cursor's rows as a JSON array of objects without loading the whole result."""
+    columns = [column[0] for column in cursor.description]
+    # Plain tuples are cheaper to fetch than sqlite3.Row and zip just as well
+    cursor.row_factory = None
+    
+    def generate():
+        yield b'['
+        separator = b''
+        while True:
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            # Encode the batch as one array and drop its brackets
+            yield separator + orjson.dumps([dict(zip(columns, row)) for row in rows])[1:-1]
+            separator = b','
+        yield b']'
+    
+    return app.response_class(stream_with_context(generate()), mimetype='application/json')
+
 # Database setup
 DB_PATH = os.path.join(os.path.dirname(__file__), 'irrigation.db')
 app.logger.info(f"Using database at: {os.path.abspath(DB_PATH)}")
 
-# Device command queue
+# Settings applied to every connection. WAL lets readers run alongside the
+# writer and synchronous=NORMAL only fsyncs at checkpoints instead of per commit.
+# Checkpoints run from a scheduled job rather than inside whichever commit
+# crosses the autocheckpoint threshold.
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-20000',
+    'PRAGMA wal_autocheckpoint=0',
+)
+
+# Prepared statements kept per connection, so the hot statements below are
+# parsed and planned once and reused on every call
+SQLITE_CACHED_STATEMENTS = 256
+
+# DELETE ... RETURNING needs SQLite 3.35; older Raspberry Pi OS releases ship 3.34
+SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Statements run on every sensor reading or watering cycle. Keeping the SQL
+# text identical lets each call hit the connection's statement cache.
+SQL_INSERT_MOISTURE = (
+    'INSERT INTO moisture_data (device_id, moisture, raw_adc_value, timestamp) VALUES (?, ?, ?, ?)'
+)
+SQL_SELECT_RULE = 'SELECT enabled, low_threshold, high_threshold FROM automation_rules WHERE device_id = ?'
+SQL_INSERT_VALVE_ACTION = 'INSERT INTO valve_actions (device_id, state) VALUES (?, ?)'
+SQL_SELECT_LAST_VALVE_STATE = (
+    'SELECT state FROM valve_actions WHERE device_id = ? ORDER BY timestamp DESC LIMIT 1'
+)
+SQL_INSERT_MEASUREMENT = '''
+    INSERT INTO plant_measurements (
+        device_id, plant_name, height, leaf_count, stem_thickness, canopy_width,
+        leaf_color, leaf_firmness, notes, fertilized, pruned
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+MEASUREMENT_UPDATE_FIELDS = (
+    'plant_name', 'height', 'leaf_count', 'stem_thickness', 'canopy_width',
+    'leaf_color', 'leaf_firmness', 'notes', 'fertilized', 'pruned'
+)
+SQL_UPDATE_MEASUREMENT = (
+    'UPDATE plant_measurements SET '
+    + ', '.join(f'{field} = CASE WHEN ? THEN ? ELSE {field} END' for field in MEASUREMENT_UPDATE_FIELDS)
+    + ' WHERE id = ?'
+)
+PROFILE_UPDATE_FIELDS = (
+    'name', 'is_default', 'watering_duration', 'wicking_wait_time',
+    'max_daily_cycles', 'sensing_interval', 'reservoir_limit',
+    'reservoir_volume', 'max_watering_per_day'
+)
+SQL_UPDATE_PROFILE = (
+    'UPDATE watering_profiles SET '
+    + ', '.join(f'{field} = CASE WHEN ? THEN ? ELSE {field} END' for field in PROFILE_UPDATE_FIELDS)
+    + ", updated_at = datetime('now') WHERE id = ?"
+)
+# History entry written by every zone and plant change
+SQL_INSERT_ZONE_HISTORY = (
+    'INSERT INTO zone_history (zone_id, plant_id, event_type, event_description) VALUES (?, ?, ?, ?)'
+)
+SQL_RESET_DAILY_CYCLES = '''
+    UPDATE automation_rules
+    SET daily_cycles = 0, cycles_reset_date = ?
+    WHERE cycles_reset_date IS NOT NULL AND cycles_reset_date != ?
+'''
+SQL_SELECT_WATERING_STATE = '''
+    SELECT CAST(strftime('%s', last_watering) AS INTEGER) AS last_watering,
+           daily_cycles, cycles_reset_date
+    FROM automation_rules WHERE device_id = ?
+'''
+SQL_UPDATE_WATERING_STATE = '''
+    UPDATE automation_rules
+    SET last_watering = ?,
+        daily_cycles = CASE WHEN cycles_reset_date = ? THEN COALESCE(daily_cycles, 0) + 1 ELSE 1 END,
+        cycles_reset_date = ?
+    WHERE device_id = ?
+'''
+
+def connect_db():
+    """Open a SQLite connection with the performance PRAGMAs applied.
+
+    Implicit transactions start with BEGIN IMMEDIATE, so a writer waits for the
+    write lock up front instead of failing to upgrade a read snapshot.
+    """
+    conn = sqlite3.connect(DB_PATH, cached_statements=SQLITE_CACHED_STATEMENTS,
+                           isolation_level='IMMEDIATE')
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+# One long-lived connection per thread, reused across requests
+_db_local = threading.local()
+
+def get_db():
+    """Get this thread's shared database connection, opening it on first use."""
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None:
+        conn = connect_db()
+        conn.row_factory = sqlite3.Row
+        _db_local.conn = conn
+    return conn
+
+# Read-side settings: journal mode and sync are owned by the writer, and
+# query_only guards the read connection against accidental writes
+SQLITE_READ_PRAGMAS = (
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-20000',
+    'PRAGMA query_only=1',
+)
+
+def get_read_db():
+    """Get this thread's read-only database connection for pure read endpoints.
+
+    Under WAL the reader never blocks, or is blocked by, the writer connections.
+    """
+    conn = getattr(_db_local, 'read_conn', None)
+    if conn is None:
+        conn = sqlite3.connect(f'file:{DB_PATH}?mode=ro', uri=True,
+                               cached_statements=SQLITE_CACHED_STATEMENTS)
+        for pragma in SQLITE_READ_PRAGMAS:
+            conn.execute(pragma)
+        conn.row_factory = sqlite3.Row
+        _db_local.read_conn = conn
+    return conn
+
+def rollback_thread_transaction():
+    """Roll back anything left uncommitted on this thread's write connection.
+
+    Writes hold BEGIN IMMEDIATE, so a transaction left open blocks every other
+    writer. Request threads call this on teardown, background threads after a failed job.
+    """
+    conn = getattr(_db_local, 'conn', None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+@app.teardown_request
+def rollback_open_transaction(exc):
+    """Roll back anything a failed request left uncommitted on the shared connection."""
+    rollback_thread_transaction()
+
+def begin_write(conn):
+    """Take the write lock before a read whose result the following writes depend on."""
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+
+def write_row_returning(cursor, sql, params, table, row_id=None):
+    """Run a single-row INSERT or UPDATE and return the row as written, or None if none was.
+
+    Without RETURNING support the row is read back by row_id, or the new
+    rowid for an insert.
+    """
+    if SQLITE_HAS_RETURNING:
+        return cursor.execute(sql + ' RETURNING *', params).fetchone()
+    
+    cursor.execute(sql, params)
+    if cursor.rowcount == 0:
+        return None
+    row_id = cursor.lastrowid if row_id is None else row_id
+    return cursor.execute(f'SELECT * FROM {table} WHERE id = ?', (row_id,)).fetchone()
+
+# Device command queue, latest command per device. Only single dict
+# operations (assignment, pop) are used so no lock is needed.
 device_commands = {}
+# Notified whenever a command is queued, for devices long-polling for one
+device_commands_queued = threading.Condition()
+COMMAND_WAIT_MAX = 25            # longest a device may wait for a command, in seconds
+# Each waiting poll holds a server thread, so only this many may wait at once.
+# Keep it below gunicorn's thread count (gunicorn.conf.py) so other requests still get served.
+COMMAND_WAITERS_MAX = int(os.environ.get('COMMAND_WAITERS_MAX', 4))
+command_waiters = threading.BoundedSemaphore(COMMAND_WAITERS_MAX)
 
-# Watering state tracking
-last_watering_times = {}
-daily_cycles = {}
-last_cycle_reset = {}
+# Watering state tracking (last watering and daily cycles live in automation_rules)
 manual_override = {}  # Track manual valve overrides
 
+# Thresholds of each device's rule as (rule or None, fetched at), oldest first.
+# Entries are dropped when a rule is saved here and expire in case it is edited
+# elsewhere. Sized like the device profile cache (PROFILE_CACHE_SIZE).
+automation_rules_cache = collections.OrderedDict()
+automation_rules_lock = threading.Lock()
+RULE_CACHE_TTL = 30              # seconds a cached rule is trusted before re-reading it
+
+def get_automation_rule(device_id, conn):
+    """Get a device's rule thresholds, from the cache when recent."""
+    now = time.monotonic()
+    with automation_rules_lock:
+        cached = automation_rules_cache.get(device_id)
+    if cached and now - cached[1] < RULE_CACHE_TTL:
+        return cached[0]
+    
+    row = conn.execute(SQL_SELECT_RULE, (device_id,)).fetchone()
+    rule = dict(row) if row else None
+    # Unknown devices are cached too, so drop the least recently fetched when full
+    with automation_rules_lock:
+        automation_rules_cache[device_id] = (rule, now)
+        automation_rules_cache.move_to_end(device_id)
+        if len(automation_rules_cache) > PROFILE_CACHE_SIZE:
+            automation_rules_cache.popitem(last=False)
+    return rule
+
 # Photo upload configuration
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+ALLOWED_EXTENSIONS = frozenset(('.png', '.jpg', '.jpeg'))
+PHOTO_COPY_BUFFER = 1 << 20      # bytes per read/write/hash step when saving uploads
+PHOTO_CACHE_MAX_AGE = 3600       # seconds browsers may reuse a photo without revalidating
+
+# Let nginx/Apache send photo files when they front the app. Apache and
+# lighttpd take X-Sendfile; nginx takes X-Accel-Redirect to an internal
+# location, e.g. PHOTO_ACCEL_REDIRECT=/protected-uploads/ mapped to the uploads folder.
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+PHOTO_ACCEL_REDIRECT = os.environ.get('PHOTO_ACCEL_REDIRECT')
+
+# Reject oversized request bodies up front instead of spooling them
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
 # Create upload folder if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+class HashingUpload:
+    """Named temporary file in the uploads folder that hashes what is written to it."""
+
+    def __init__(self):
+        self.file = tempfile.NamedTemporaryFile('w+b', dir=UPLOAD_FOLDER, delete=False,
+                                                buffering=PHOTO_COPY_BUFFER)
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+class UploadRequest(Request):
+    """Spool uploaded files straight into the uploads folder.
+
+    The form parser writes each file once, hashing it on the way, so
+    upload_photo only renames the finished file into place. Files a handler
+    did not keep are removed when the request closes.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        upload = HashingUpload()
+        self.__dict__.setdefault('spooled_uploads', []).append(upload.name)
+        return upload
+
+    def close(self):
+        super().close()
+        for path in self.__dict__.get('spooled_uploads', ()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+app.request_class = UploadRequest
+
+# Photo files are unlinked in the background once their rows are deleted,
+# so delete requests return without waiting on the filesystem
+photo_delete_executor = ThreadPoolExecutor(max_workers=2)
+# Held while deciding a shared photo file is unused and unlinking it, and while
+# an upload reuses that file and commits its row, so neither sees a stale answer
+photo_files_lock = threading.Lock()
+
+def remove_photo_file(file_path, dir_fd=None):
+    """Delete a photo file, ignoring files that are already gone.
+
+    With dir_fd (an open uploads folder), files in that folder are unlinked
+    by name relative to it instead of resolving the full path every time.
+    """
+    try:
+        if dir_fd is not None and os.path.dirname(file_path) == UPLOAD_FOLDER:
+            os.unlink(os.path.basename(file_path), dir_fd=dir_fd)
+        else:
+            os.remove(file_path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        app.logger.warning('Error deleting photo file %s: %s', file_path, e)
+
+def unlink_unused_photos(file_paths):
+    """Delete the photo files no remaining photo refers to."""
+    with photo_files_lock:
+        try:
+            conn = get_db()
+            # Uploads are named by content hash, so identical photos share one file
+            unused = [
+                file_path for file_path in set(file_paths)
+                if not conn.execute('SELECT 1 FROM plant_photos WHERE file_path = ? LIMIT 1', (file_path,)).fetchone()
+            ]
+        except Exception:
+            app.logger.exception('Error checking photo files')
+            return
+        
+        if os.unlink not in os.supports_dir_fd:
+            for file_path in unused:
+                remove_photo_file(file_path)
+            return
+        
+        dir_fd = os.open(UPLOAD_FOLDER, os.O_RDONLY)
+        try:
+            for file_path in unused:
+                remove_photo_file(file_path, dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def remove_photo_files(file_paths):
+    """Queue the files of deleted photo rows for removal in the background."""
+    if file_paths:
+        photo_delete_executor.submit(unlink_unused_photos, list(file_paths))
+
+def delete_photo_rows(cursor, where, params):
+    """Delete the plant_photos rows matching where and return their file paths."""
+    if SQLITE_HAS_RETURNING:
+        cursor.execute(f'DELETE FROM plant_photos WHERE {where} RETURNING file_path', params)
+        return [row[0] for row in cursor.fetchall()]
+    
+    cursor.execute(f'SELECT file_path FROM plant_photos WHERE {where}', params)
+    file_paths = [row[0] for row in cursor.fetchall()]
+    cursor.execute(f'DELETE FROM plant_photos WHERE {where}', params)
+    return file_paths
+
 def allowed_file(filename):
     """Check if the file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
 
 # Default watering control constants (will be overridden by profiles)
 DEFAULT_WICKING_WAIT_TIME = 60 * 60  # 60 minutes in seconds
@@ -72,13 +467,71 @@ DEFAULT_MAX_DAILY_CYCLES = 4         # Maximum watering cycles per day
 DEFAULT_SENSING_INTERVAL = 5 * 60    # 5 minutes in seconds
 
 # In-memory state tracking 
-device_profiles = {}  # Maps device_id to active profile
+device_profiles = collections.OrderedDict()  # Maps device_id to (active profile, fetched at), oldest first
+device_profiles_lock = threading.Lock()
+PROFILE_CACHE_TTL = 30           # seconds a cached profile is trusted before re-reading it
+PROFILE_CACHE_SIZE = 1024        # devices kept in the profile cache
+last_valve_states = {}  # Maps device_id to last recorded valve state
+
+# Payloads of read-mostly endpoints as key -> (payload, cached at), oldest first.
+# Writes in this process drop the affected entries, the TTL covers edits made elsewhere.
+RESPONSE_CACHE_TTL = 60          # seconds a cached response is served
+RESPONSE_CACHE_SIZE = 256        # entries kept in each response cache
+zones_cache = collections.OrderedDict()     # The zone list, under the key None
+photos_cache = collections.OrderedDict()    # Maps measurement_id to its photo list
+profiles_cache = collections.OrderedDict()  # Maps device_id to its profile list
+response_cache_lock = threading.Lock()
+
+def cache_get(cache, key):
+    """Return a cached payload, or None if missing or expired."""
+    with response_cache_lock:
+        entry = cache.get(key)
+    if entry and time.monotonic() - entry[1] < RESPONSE_CACHE_TTL:
+        return entry[0]
+    return None
+
+def cache_put(cache, key, payload):
+    """Cache a payload. When full, expired entries go first, then the oldest."""
+    now = time.monotonic()
+    with response_cache_lock:
+        cache[key] = (payload, now)
+        cache.move_to_end(key)
+        if len(cache) > RESPONSE_CACHE_SIZE:
+            while cache and now - next(iter(cache.values()))[1] >= RESPONSE_CACHE_TTL:
+                cache.popitem(last=False)
+            while len(cache) > RESPONSE_CACHE_SIZE:
+                cache.popitem(last=False)
+    return payload
+
+def cache_drop(cache, key=None, everything=False):
+    """Drop one cached payload, or the whole cache after a write that may touch any entry."""
+    with response_cache_lock:
+        if everything:
+            cache.clear()
+        else:
+            cache.pop(key, None)
+
+# Indexes for the tables manage_db.py creates: plants by zone, zone history
+# newest first and a device's profiles by last update
+ZONE_PROFILE_INDEXES = (
+    ('plants', 'CREATE INDEX IF NOT EXISTS idx_plants_zone ON plants(zone_id)'),
+    ('zone_history', 'CREATE INDEX IF NOT EXISTS idx_zone_history_zone_ts ON zone_history(zone_id, timestamp DESC)'),
+    ('watering_profiles', 'CREATE INDEX IF NOT EXISTS idx_profiles_device_updated ON watering_profiles(device_id, updated_at DESC)'),
+)
 
 def init_db():
     """Initialize the database with required tables if they don't exist."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db()
     cursor = conn.cursor()
     
+    # A brand new database gets incremental auto-vacuum so space freed by
+    # deletes can be reclaimed later. The mode can only change before any
+    # tables exist, and the VACUUM that applies it is free while empty.
+    cursor.execute('SELECT COUNT(*) FROM sqlite_master')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        cursor.execute('VACUUM')
+    
     # Create moisture_data table with raw_adc_value column
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS moisture_data (
@@ -141,11 +594,56 @@ def init_db():
         measurement_id INTEGER NOT NULL,
         filename TEXT NOT NULL,
         file_path TEXT NOT NULL,
+        mime_type TEXT,
         timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY(measurement_id) REFERENCES plant_measurements(id) ON DELETE CASCADE
     )
     ''')
-    
+
+    # Add watering state columns to automation_rules tables created without them
+    cursor.execute('PRAGMA table_info(automation_rules)')
+    rule_columns = {row[1] for row in cursor.fetchall()}
+    for column, definition in (('last_watering', 'TEXT'),
+                               ('daily_cycles', 'INTEGER DEFAULT 0'),
+                               ('cycles_reset_date', 'TEXT')):
+        if column not in rule_columns:
+            cursor.execute(f'ALTER TABLE automation_rules ADD COLUMN {column} {definition}')
+
+    # Photos uploaded before the content type was recorded keep NULL and fall back to their extension
+    cursor.execute('PRAGMA table_info(plant_photos)')
+    if 'mime_type' not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute('ALTER TABLE plant_photos ADD COLUMN mime_type TEXT')
+
+    # Indexes for the per-device history and range queries
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_moisture_device_ts ON moisture_data(device_id, timestamp DESC)')
+    # Covers valve state lookups as well, so the latest state is read from the index alone
+    cursor.execute('DROP INDEX IF EXISTS idx_valve_device_ts')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_valve_cover ON valve_actions(device_id, timestamp DESC, state)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_plant_device_ts ON plant_measurements(device_id, timestamp DESC)')
+    # Deleting a plant looks its measurements up by name
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_plant_device_name ON plant_measurements(device_id, plant_name)')
+
+    # One rule per device. Older databases may hold duplicates, keep the newest of each.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_rules_device_unique'")
+    if not cursor.fetchone():
+        cursor.execute('DELETE FROM automation_rules WHERE id NOT IN (SELECT MAX(id) FROM automation_rules GROUP BY device_id)')
+        cursor.execute('DROP INDEX IF EXISTS idx_rules_device')
+        cursor.execute('CREATE UNIQUE INDEX idx_rules_device_unique ON automation_rules(device_id)')
+    # Includes file_path so deletes find a measurement's photo files from the index alone
+    cursor.execute('DROP INDEX IF EXISTS idx_photos_measurement')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_photos_measurement_path ON plant_photos(measurement_id, file_path)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_photos_file_path ON plant_photos(file_path)')
+
+    # The zone and profile tables are created by manage_db.py, index them once they exist
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    tables = {row[0] for row in cursor.fetchall()}
+    for table, index in ZONE_PROFILE_INDEXES:
+        if table in tables:
+            cursor.execute(index)
+
+    # Refresh planner statistics so the indexes above are picked up
+    cursor.execute('ANALYZE')
+
     conn.commit()
     conn.close()
 
@@ -154,13 +652,15 @@ init_db()
 
 def get_device_profile(device_id):
     """Get the active watering profile for a device."""
-    # Return from cache if available
-    if device_id in device_profiles:
-        return device_profiles[device_id]
+    # Return from cache if available and recent, profiles may also be edited outside this process
+    now = time.monotonic()
+    with device_profiles_lock:
+        cached = device_profiles.get(device_id)
+    if cached and now - cached[1] < PROFILE_CACHE_TTL:
+        return cached[0]
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_db()
         cursor = conn.cursor()
         
         # First try to get the default profile for this device
@@ -179,11 +679,11 @@ def get_device_profile(device_id):
             )
             profile = cursor.fetchone()
         
-        conn.close()
-        
-        # If we still don't have a profile, return default values
-        if not profile:
-            return {
+        # If we still don't have a profile, use default values
+        if profile:
+            profile_dict = dict(profile)
+        else:
+            profile_dict = {
                 'name': 'Default',
                 'watering_duration': DEFAULT_WATERING_DURATION,
                 'wicking_wait_time': DEFAULT_WICKING_WAIT_TIME,
@@ -194,13 +694,16 @@ def get_device_profile(device_id):
                 'max_watering_per_day': None
             }
         
-        # Cache the profile
-        profile_dict = dict(profile)
-        device_profiles[device_id] = profile_dict
+        # Cache the profile, dropping the least recently fetched device when full
+        with device_profiles_lock:
+            device_profiles[device_id] = (profile_dict, now)
+            device_profiles.move_to_end(device_id)
+            if len(device_profiles) > PROFILE_CACHE_SIZE:
+                device_profiles.popitem(last=False)
         return profile_dict
     
-    except Exception as e:
-        print(f"Error getting device profile: {str(e)}")
+    except Exception:
+        app.logger.exception('Error getting device profile')
         # Return default values on error
         return {
             'name': 'Default',
@@ -215,10 +718,52 @@ def get_device_profile(device_id):
 
 def refresh_device_profile(device_id):
     """Force refresh the cached profile for a device."""
-    if device_id in device_profiles:
-        del device_profiles[device_id]
+    with device_profiles_lock:
+        device_profiles.pop(device_id, None)
+    cache_drop(profiles_cache, device_id)
     return get_device_profile(device_id)
 
+def is_number(value):
+    """True for JSON numbers, bools are not readings."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def is_adc_value(value):
+    """True for an integer ADC reading, or None when the device sent none."""
+    return value is None or (isinstance(value, int) and not isinstance(value, bool))
+
+def utc_timestamp(epoch):
+    """Format epoch seconds as UTC 'YYYY-MM-DD HH:MM:SS', the text CURRENT_TIMESTAMP stores."""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch))
+
+# (start, end, 'YYYY-MM-DD') of the local day last seen by local_date()
+_local_day = (0.0, 0.0, None)
+
+def local_date(current_time):
+    """Get the local calendar date for an epoch time, only recomputing it when the day changes."""
+    global _local_day
+    start, end, date = _local_day
+    if start <= current_time < end:
+        return date
+    
+    # Midnight to midnight in local time, mktime handles DST and month rollover
+    tm = time.localtime(current_time)
+    start = time.mktime((tm.tm_year, tm.tm_mon, tm.tm_mday, 0, 0, 0, 0, 0, -1))
+    end = time.mktime((tm.tm_year, tm.tm_mon, tm.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+    date = time.strftime('%Y-%m-%d', tm)
+    _local_day = (start, end, date)
+    return date
+
+def get_watering_state(device_id, current_time):
+    """Get the last watering time (epoch seconds) and today's cycle count for a device."""
+    row = get_db().execute(SQL_SELECT_WATERING_STATE, (device_id,)).fetchone()
+    if not row:
+        return 0, 0
+    
+    # Cycle counts only apply to the day they were recorded on
+    today = local_date(current_time)
+    cycles_today = (row['daily_cycles'] or 0) if row['cycles_reset_date'] == today else 0
+    return row['last_watering'] or 0, cycles_today
+
 def can_water_device(device_id, current_time=None):
     """Check if it's safe to water the device based on timing rules."""
     if current_time is None:
@@ -227,95 +772,243 @@ def can_water_device(device_id, current_time=None):
     # Get device profile
     profile = get_device_profile(device_id)
     
-    # Initialize tracking for new devices
-    if device_id not in last_watering_times:
-        last_watering_times[device_id] = 0
-    if device_id not in daily_cycles:
-        daily_cycles[device_id] = 0
-    if device_id not in last_cycle_reset:
-        last_cycle_reset[device_id] = current_time
-    if device_id not in manual_override:
-        manual_override[device_id] = False
-    
-    # Reset daily cycles and manual override at midnight
-    current_date = datetime.datetime.fromtimestamp(current_time).date()
-    last_reset_date = datetime.datetime.fromtimestamp(last_cycle_reset[device_id]).date()
-    
-    if current_date != last_reset_date:
-        daily_cycles[device_id] = 0
-        manual_override[device_id] = False  # Reset manual override at midnight
-        last_cycle_reset[device_id] = current_time
+    last_watering, cycles_today = get_watering_state(device_id, current_time)
     
     # Check timing rules
-    time_since_last_water = current_time - last_watering_times[device_id]
+    time_since_last_water = current_time - last_watering
     
     # Apply profile rules
     max_daily_cycles = profile['max_daily_cycles']
     wicking_wait_time = profile['wicking_wait_time']
     
     # Calculate amount of water used today
-    water_used_today = daily_cycles[device_id] * (profile['watering_duration'] / 60)  # in minutes
+    water_used_today = cycles_today * (profile['watering_duration'] / 60)  # in minutes
     
     # Check if we're about to exceed reservoir limits
     if profile['max_watering_per_day'] and water_used_today >= profile['max_watering_per_day']:
-        print(f"Cannot water: Maximum daily watering limit reached ({water_used_today} minutes)")
+        app.logger.debug('Cannot water %s: daily watering limit reached (%s minutes)', device_id, water_used_today)
         return False
     
     return (time_since_last_water >= wicking_wait_time and 
-            daily_cycles[device_id] < max_daily_cycles)
+            cycles_today < max_daily_cycles)
 
-def update_watering_state(device_id, current_time=None):
-    """Update the watering state for a device."""
+def update_watering_state(device_id, current_time=None, conn=None):
+    """Update the watering state for a device.
+
+    When conn is given the update joins the caller's transaction instead of committing.
+    """
     if current_time is None:
         current_time = time.time()
     
-    last_watering_times[device_id] = current_time
-    daily_cycles[device_id] += 1
+    last_watering = utc_timestamp(current_time)
+    today = local_date(current_time)
+    
+    if conn is not None:
+        conn.execute(SQL_UPDATE_WATERING_STATE, (last_watering, today, today, device_id))
+        return
+    
+    db = get_db()
+    try:
+        db.execute(SQL_UPDATE_WATERING_STATE, (last_watering, today, today, device_id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+# Shared scheduler for delayed jobs such as ending a watering cycle. One
+# thread runs every job, so pending jobs cost a heap entry instead of a thread.
+scheduler_wakeup = threading.Event()
+
+def _scheduler_delay(seconds):
+    """Sleep until the next job is due, waking early when a job is added."""
+    scheduler_wakeup.wait(seconds)
+    scheduler_wakeup.clear()
+
+scheduler = sched.scheduler(time.monotonic, _scheduler_delay)
+
+def schedule_job(delay, action, *args):
+    """Run action(*args) on the scheduler thread after delay seconds."""
+    event = scheduler.enter(delay, 1, action, args)
+    scheduler_wakeup.set()
+    return event
+
+def scheduler_worker():
+    """Background worker that runs scheduled jobs as they come due."""
+    while True:
+        try:
+            scheduler.run()
+        except Exception:
+            app.logger.exception('Error in scheduled job')
+            rollback_thread_transaction()
+            continue
+        # Queue is empty, wait for the next job to be added
+        scheduler_wakeup.wait()
+        scheduler_wakeup.clear()
+
+# Sensor readings are buffered in memory and written in batches so that
+# many device POSTs share a single transaction.
+SENSOR_FLUSH_INTERVAL = 1        # seconds between flushes
+SENSOR_FLUSH_BATCH_SIZE = 500    # flush early once this many readings are pending
+SENSOR_BUFFER_LIMIT = 10000      # readings held before new ones are refused
+pending_readings = collections.deque()
+pending_readings_lock = threading.Lock()
+sensor_flush_requested = threading.Event()
+
+# Automation checks run one at a time off the request thread, in the order readings arrive
+automation_executor = ThreadPoolExecutor(max_workers=1)
+
+# Errors from a reading's own values rather than from the database
+READING_BIND_ERRORS = (sqlite3.InterfaceError, sqlite3.ProgrammingError, OverflowError)
+
+def insert_readings_individually(conn, rows):
+    """Insert readings one at a time, dropping those that cannot be bound. Returns the stored rows."""
+    stored = []
+    for row in rows:
+        try:
+            conn.execute(SQL_INSERT_MOISTURE, row)
+        except READING_BIND_ERRORS:
+            app.logger.exception('Dropping sensor reading that cannot be stored: %r', row)
+            continue
+        stored.append(row)
+    return stored
+
+def flush_sensor_readings():
+    """Write all buffered sensor readings to the database in one transaction.
+
+    Readings that cannot be bound are logged and dropped so they don't hold
+    back the rest. If the database itself fails (locked, busy, I/O) the
+    readings go back to the front of the buffer, as far as SENSOR_BUFFER_LIMIT
+    allows, and the error is raised.
+    """
+    with pending_readings_lock:
+        rows = list(pending_readings)
+        pending_readings.clear()
+    
+    if not rows:
+        return 0
+    
+    conn = get_db()
+    try:
+        try:
+            conn.executemany(SQL_INSERT_MOISTURE, rows)
+        except READING_BIND_ERRORS:
+            conn.rollback()
+            rows = insert_readings_individually(conn, rows)
+        conn.commit()
+    except sqlite3.OperationalError:
+        conn.rollback()
+        with pending_readings_lock:
+            # Keep the oldest readings, newer ones arrived while the write was running
+            room = max(SENSOR_BUFFER_LIMIT - len(pending_readings), 0)
+            pending_readings.extendleft(reversed(rows[:room]))
+        if room < len(rows):
+            app.logger.error('Sensor buffer full, dropped %d readings', len(rows) - room)
+        raise
+    except Exception:
+        conn.rollback()
+        raise
+    return len(rows)
+
+def sensor_flusher():
+    """Background worker that periodically flushes buffered sensor readings."""
+    while True:
+        sensor_flush_requested.wait(SENSOR_FLUSH_INTERVAL)
+        sensor_flush_requested.clear()
+        try:
+            flush_sensor_readings()
+        except Exception:
+            app.logger.exception('Error flushing sensor readings')
 
 @app.route('/api/sensor-data', methods=['POST'])
 def receive_sensor_data():
-    """Endpoint to receive sensor data from Pico W devices."""
+    """Endpoint to receive sensor data from Pico W devices.
+
+    moisture may also be a list of samples sent together, with timestamps
+    (Unix seconds) and optionally raw_adc_value as lists of the same length.
+    A single reading is stamped with the time it arrives.
+    """
     try:
         data = request.json
-        if not data or 'device_id' not in data or 'moisture' not in data:
+        if (not isinstance(data, dict) or 'moisture' not in data
+                or not isinstance(data.get('device_id'), str) or not data['device_id']):
             return jsonify({'error': 'Invalid data format'}), 400
         
         device_id = data['device_id']
-        moisture = float(data['moisture'])
-        raw_adc_value = data.get('raw_adc_value')  # New field for ADC value
-        
-        # Initialize watering state for new devices
         current_time = time.time()
-        if device_id not in last_watering_times:
-            last_watering_times[device_id] = current_time - DEFAULT_WICKING_WAIT_TIME  # Allow immediate watering
-            daily_cycles[device_id] = 0
-            last_cycle_reset[device_id] = current_time
         
-        # Store in database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO moisture_data (device_id, moisture, raw_adc_value) VALUES (?, ?, ?)',
-            (device_id, moisture, raw_adc_value)
-        )
-        conn.commit()
-        conn.close()
-        
-        # Check automation rules
-        check_automation_rules(device_id, moisture)
+        if isinstance(data['moisture'], list):
+            moistures = data['moisture']
+            raw_adc_values = data.get('raw_adc_value')
+            if raw_adc_values is None:
+                raw_adc_values = [None] * len(moistures)
+            # Every sample needs its own time, stamping them all on arrival would collide
+            timestamps = data.get('timestamps')
+            if (not moistures
+                    or not isinstance(raw_adc_values, list)
+                    or not isinstance(timestamps, list)
+                    or len(raw_adc_values) != len(moistures)
+                    or len(timestamps) != len(moistures)
+                    or not all(is_number(value) for value in moistures)
+                    or not all(is_number(value) for value in timestamps)
+                    or not all(is_adc_value(value) for value in raw_adc_values)):
+                return jsonify({'error': 'Invalid data format'}), 400
+        else:
+            try:
+                moistures = [float(data['moisture'])]
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid data format'}), 400
+            raw_adc_values = [data.get('raw_adc_value')]  # New field for ADC value
+            if not is_adc_value(raw_adc_values[0]):
+                return jsonify({'error': 'Invalid data format'}), 400
+            timestamps = [current_time]
+        
+        # Queue for the next batched insert, stamped like CURRENT_TIMESTAMP (UTC)
+        try:
+            rows = [
+                (device_id, float(moisture), raw_adc_value, utc_timestamp(timestamp))
+                for moisture, raw_adc_value, timestamp in zip(moistures, raw_adc_values, timestamps)
+            ]
+        except (OverflowError, OSError, ValueError):
+            return jsonify({'error': 'Timestamp out of range'}), 400
+        with pending_readings_lock:
+            if len(pending_readings) + len(rows) > SENSOR_BUFFER_LIMIT:
+                # The writer is falling behind, the device retries on its next reading
+                sensor_flush_requested.set()
+                return jsonify({'error': 'Sensor buffer full'}), 503
+            pending_readings.extend(rows)
+            if len(pending_readings) >= SENSOR_FLUSH_BATCH_SIZE:
+                sensor_flush_requested.set()
+        
+        moisture = moistures[-1]
+        
+        # Check automation rules without holding up the device's request
+        automation_executor.submit(check_automation_rules, device_id, moisture)
         
         return jsonify({'status': 'success'}), 200
     except Exception as e:
-        print(f"Error in receive_sensor_data: {str(e)}")
+        app.logger.error('Error in receive_sensor_data: %s', e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/commands/<device_id>', methods=['GET'])
 def get_commands(device_id):
-    """Endpoint for devices to check for pending commands."""
-    if device_id in device_commands:
-        command = device_commands.pop(device_id)
-        return jsonify({'command': command}), 200
-    return jsonify({'command': None}), 200
+    """Endpoint for devices to check for pending commands.
+
+    With wait=<seconds> (at most 25) the request is held until a command is
+    queued or the time runs out, instead of answering null straight away.
+    When COMMAND_WAITERS_MAX polls are already waiting it answers at once.
+    """
+    wait = min(request.args.get('wait', 0, type=float), COMMAND_WAIT_MAX)
+    
+    # A single pop() so two concurrent polls can't both see the same command
+    command = device_commands.pop(device_id, None)
+    if command is None and wait > 0 and command_waiters.acquire(blocking=False):
+        try:
+            with device_commands_queued:
+                device_commands_queued.wait_for(lambda: device_id in device_commands, timeout=wait)
+        finally:
+            command_waiters.release()
+        command = device_commands.pop(device_id, None)
+    return jsonify({'command': command}), 200
 
 @app.route('/api/valve/control', methods=['POST'])
 def control_valve():
@@ -335,66 +1028,107 @@ def control_valve():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Period expressions for downsampled moisture analytics
+MOISTURE_BUCKETS = {
+    'hour': "strftime('%Y-%m-%d %H:00:00', timestamp)",
+    'day': "strftime('%Y-%m-%d 00:00:00', timestamp)",
+}
+
 @app.route('/api/analytics/moisture', methods=['GET'])
 def get_moisture_analytics():
-    """Endpoint to retrieve moisture analytics."""
+    """Endpoint to retrieve moisture analytics.
+
+    Optional parameters: bucket=hour|day averages readings per period, limit
+    returns only the newest rows, and before (a timestamp) pages further back.
+    Timestamps are not unique, so to page raw readings pass the oldest row's
+    timestamp as before and its id as before_id.
+    """
     try:
         device_id = request.args.get('device_id')
-        days = int(request.args.get('days', 1))
+        days = request.args.get('days', 1, type=int)
+        bucket = request.args.get('bucket')
+        limit = request.args.get('limit', type=int)
+        before = request.args.get('before')
+        before_id = request.args.get('before_id', type=int)
         
         if not device_id:
             return jsonify({'error': 'Device ID is required'}), 400
+        if bucket and bucket not in MOISTURE_BUCKETS:
+            return jsonify({'error': 'Bucket must be hour or day'}), 400
+        
+        # SQLite works out the cutoff, in the same UTC text format CURRENT_TIMESTAMP stores
+        cutoff = f'-{days} days'
+        
+        where = "device_id = ? AND timestamp >= datetime('now', ?)"
+        params = [device_id, cutoff]
+        if before and before_id is not None and not bucket:
+            # Rows sharing the boundary second are split by id, so none are skipped
+            where += ' AND (timestamp < ? OR (timestamp = ? AND id < ?))'
+            params.extend((before, before, before_id))
+        elif before:
+            where += ' AND timestamp < ?'
+            params.append(before)
+        
+        if bucket:
+            # Aggregate in SQL so only one row per period leaves the database
+            query = f'''SELECT {MOISTURE_BUCKETS[bucket]} AS timestamp, AVG(moisture) AS moisture,
+                              MIN(moisture) AS min_moisture, MAX(moisture) AS max_moisture,
+                              COUNT(*) AS samples
+                       FROM moisture_data WHERE {where}
+                       GROUP BY 1'''
+        else:
+            query = f'''SELECT id, device_id, moisture, raw_adc_value, timestamp FROM moisture_data 
+                       WHERE {where}'''
+        
+        # Raw rows are ordered by (timestamp, id) to match the before/before_id cursor
+        order = 'timestamp' if bucket else 'timestamp, id'
+        if limit:
+            # Newest rows first to apply the limit, then back to chronological order
+            newest_first = 'timestamp DESC' if bucket else 'timestamp DESC, id DESC'
+            query = f'SELECT * FROM ({query} ORDER BY {newest_first} LIMIT ?) ORDER BY {order}'
+            params.append(limit)
+        else:
+            query += f' ORDER BY {order}'
         
-        # Calculate timestamp for filtering
-        timestamp = datetime.datetime.now() - datetime.timedelta(days=days)
-        timestamp_str = timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_read_db()
         cursor = conn.cursor()
+        cursor.execute(query, params)
         
-        cursor.execute(
-            '''SELECT * FROM moisture_data 
-               WHERE device_id = ? AND timestamp >= ? 
-               ORDER BY timestamp''',
-            (device_id, timestamp_str)
-        )
-        
-        rows = cursor.fetchall()
-        result = [dict(row) for row in rows]
-        conn.close()
-        
-        return jsonify(result), 200
+        return stream_json_rows(cursor)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Valve history columns, in SELECT order
+VALVE_ACTION_COLUMNS = ('id', 'device_id', 'state', 'timestamp')
+VALVE_HISTORY_MAX_LIMIT = 1000   # most valve actions returned per page
+
 @app.route('/api/analytics/valve', methods=['GET'])
 def get_valve_history():
     """Endpoint to retrieve valve action history."""
     try:
         device_id = request.args.get('device_id')
-        days = int(request.args.get('days', 1))
+        days = request.args.get('days', 1, type=int)
         
         # Pagination parameters
-        page = int(request.args.get('page', 1))  # Default to page 1
-        limit = int(request.args.get('limit', 100))  # Default to 100 records per page
+        page = max(request.args.get('page', 1, type=int), 1)  # Default to page 1
+        limit = min(max(request.args.get('limit', 100, type=int), 1), VALVE_HISTORY_MAX_LIMIT)  # Default to 100 records per page
         
         if not device_id:
             return jsonify({'error': 'Device ID is required'}), 400
         
-        # Calculate timestamp for filtering
-        timestamp = datetime.datetime.now() - datetime.timedelta(days=days)
-        timestamp_str = timestamp.strftime('%Y-%m-%d %H:%M:%S')
+        # SQLite works out the cutoff, in the same UTC text format CURRENT_TIMESTAMP stores
+        cutoff = f'-{days} days'
         
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_read_db()
         cursor = conn.cursor()
+        # Plain tuples are cheaper to fetch than sqlite3.Row and zip just as well
+        cursor.row_factory = None
         
         # Get the total count first for pagination metadata
         cursor.execute(
             '''SELECT COUNT(*) FROM valve_actions 
-               WHERE device_id = ? AND timestamp >= ?''',
-            (device_id, timestamp_str)
+               WHERE device_id = ? AND timestamp >= datetime('now', ?)''',
+            (device_id, cutoff)
         )
         total_count = cursor.fetchone()[0]
         
@@ -403,16 +1137,14 @@ def get_valve_history():
         
         # Get paginated data
         cursor.execute(
-            '''SELECT * FROM valve_actions 
-               WHERE device_id = ? AND timestamp >= ? 
+            '''SELECT id, device_id, state, timestamp FROM valve_actions 
+               WHERE device_id = ? AND timestamp >= datetime('now', ?)
                ORDER BY timestamp DESC
                LIMIT ? OFFSET ?''',
-            (device_id, timestamp_str, limit, offset)
+            (device_id, cutoff, limit, offset)
         )
         
-        rows = cursor.fetchall()
-        result = [dict(row) for row in rows]
-        conn.close()
+        result = [dict(zip(VALVE_ACTION_COLUMNS, row)) for row in cursor.fetchall()]
         
         # Add pagination metadata
         pagination = {
@@ -425,7 +1157,7 @@ def get_valve_history():
         return jsonify({
             'data': result,
             'pagination': pagination
-        }), 200
+        })
     except Exception as e:
         app.logger.error(f"Error retrieving valve history: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -439,8 +1171,7 @@ def get_automation_rules():
         if not device_id:
             return jsonify({'error': 'Device ID is required'}), 400
         
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_read_db()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -449,7 +1180,6 @@ def get_automation_rules():
         )
         
         row = cursor.fetchone()
-        conn.close()
         
         if row:
             return jsonify(dict(row)), 200
@@ -478,231 +1208,270 @@ def set_automation_rules():
         low_threshold = float(data['low_threshold'])
         high_threshold = float(data['high_threshold'])
         
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
-        # Check if rule exists
+        # Create the rule or update the existing one in a single statement
         cursor.execute(
-            'SELECT id FROM automation_rules WHERE device_id = ?',
-            (device_id,)
+            '''INSERT INTO automation_rules 
+               (device_id, enabled, low_threshold, high_threshold) 
+               VALUES (?, ?, ?, ?)
+               ON CONFLICT(device_id) DO UPDATE SET
+                   enabled = excluded.enabled,
+                   low_threshold = excluded.low_threshold,
+                   high_threshold = excluded.high_threshold''',
+            (device_id, enabled, low_threshold, high_threshold)
         )
         
-        row = cursor.fetchone()
-        
-        if row:
-            # Update existing rule
-            cursor.execute(
-                '''UPDATE automation_rules 
-                   SET enabled = ?, low_threshold = ?, high_threshold = ? 
-                   WHERE device_id = ?''',
-                (enabled, low_threshold, high_threshold, device_id)
-            )
-        else:
-            # Create new rule
-            cursor.execute(
-                '''INSERT INTO automation_rules 
-                   (device_id, enabled, low_threshold, high_threshold) 
-                   VALUES (?, ?, ?, ?)''',
-                (device_id, enabled, low_threshold, high_threshold)
-            )
-        
         conn.commit()
-        conn.close()
+        with automation_rules_lock:
+            automation_rules_cache.pop(device_id, None)
         
         return jsonify({'status': 'success'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def check_automation_rules(device_id, moisture):
-    """Check automation rules and control valve if needed."""
+def check_automation_rules(device_id, moisture, conn=None):
+    """Check automation rules and control valve if needed.
+
+    Callers that already hold a connection can pass it in.
+    """
     try:
-        print(f"\nChecking automation rules for device {device_id}")
-        print(f"Current moisture level: {moisture:.1f}%")
+        app.logger.debug('Checking automation rules for device %s', device_id)
+        app.logger.debug('Current moisture level: %.1f%%', moisture)
         
         # Get device profile
         profile = get_device_profile(device_id)
         
         # Check for manual override
         if device_id in manual_override and manual_override[device_id]:
-            print("Manual override is active - skipping automation")
+            app.logger.debug('Manual override is active - skipping automation')
             return
         
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            'SELECT * FROM automation_rules WHERE device_id = ?',
-            (device_id,)
-        )
-        
-        rule = cursor.fetchone()
-        conn.close()
+        if conn is None:
+            conn = get_db()
+        rule = get_automation_rule(device_id, conn)
         
         if rule and rule['enabled']:
-            print(f"Found active automation rule:")
-            print(f"- Low threshold: {rule['low_threshold']}%")
-            print(f"- High threshold: {rule['high_threshold']}%")
-            print(f"- Using profile: {profile['name']}")
+            app.logger.debug('Found active automation rule:')
+            app.logger.debug('- Low threshold: %s%%', rule['low_threshold'])
+            app.logger.debug('- High threshold: %s%%', rule['high_threshold'])
+            app.logger.debug('- Using profile: %s', profile['name'])
             
             current_time = time.time()
             
             if moisture <= rule['low_threshold']:
-                print(f"Moisture ({moisture:.1f}%) is below low threshold ({rule['low_threshold']}%)")
+                app.logger.debug('Moisture (%.1f%%) is below low threshold (%s%%)', moisture, rule['low_threshold'])
                 # Only water if timing rules allow
                 if can_water_device(device_id, current_time):
-                    print("Starting watering cycle...")
+                    app.logger.info('Starting watering cycle for device %s', device_id)
                     # Start watering cycle
                     control_valve_internal(device_id, 1, is_manual=False)
                     
                     # Schedule valve turn off after watering duration from profile
-                    def turn_off_valve():
-                        time.sleep(profile['watering_duration'])
-                        print(f"Watering cycle complete for device {device_id}")
-                        control_valve_internal(device_id, 0, is_manual=False)
-                        update_watering_state(device_id)
-                    
-                    # Start timer thread
-                    timer_thread = threading.Thread(target=turn_off_valve)
-                    timer_thread.daemon = True
-                    timer_thread.start()
+                    schedule_job(profile['watering_duration'], finish_watering_cycle, device_id)
                 else:
-                    print("Cannot water due to timing rules:")
-                    print(f"- Time since last water: {(current_time - last_watering_times[device_id]) / 60:.1f} minutes")
-                    print(f"- Daily cycles used: {daily_cycles[device_id]} of {profile['max_daily_cycles']}")
+                    last_watering, cycles_today = get_watering_state(device_id, current_time)
+                    app.logger.debug('Cannot water due to timing rules:')
+                    app.logger.debug('- Time since last water: %.1f minutes', (current_time - last_watering) / 60)
+                    app.logger.debug('- Daily cycles used: %s of %s', cycles_today, profile['max_daily_cycles'])
             
             elif moisture >= rule['high_threshold']:
-                print(f"Moisture ({moisture:.1f}%) is above high threshold ({rule['high_threshold']}%)")
-                print("Turning valve OFF")
+                app.logger.debug('Moisture (%.1f%%) is above high threshold (%s%%)', moisture, rule['high_threshold'])
+                app.logger.debug('Turning valve OFF')
                 # Turn off valve if moisture is high enough
                 control_valve_internal(device_id, 0, is_manual=False)
             else:
-                print(f"Moisture ({moisture:.1f}%) is within normal range ({rule['low_threshold']}% - {rule['high_threshold']}%)")
+                app.logger.debug('Moisture (%.1f%%) is within normal range (%s%% - %s%%)', moisture, rule['low_threshold'], rule['high_threshold'])
         else:
-            print("No active automation rule found for this device")
+            app.logger.debug('No active automation rule found for this device')
     
-    except Exception as e:
-        print(f"Error in automation: {str(e)}")
+    except Exception:
+        app.logger.exception('Error in automation')
+        rollback_thread_transaction()
+
+def get_last_valve_state(device_id):
+    """Get the last recorded valve state for a device, loading it from the database on first use."""
+    if device_id not in last_valve_states:
+        row = get_db().execute(SQL_SELECT_LAST_VALVE_STATE, (device_id,)).fetchone()
+        last_valve_states[device_id] = row['state'] if row else None
+    return last_valve_states[device_id]
+
+def queue_valve_command(device_id, state):
+    """Queue a valve command for the device and wake any poll waiting for it."""
+    command = 'valve:' + str(state)
+    device_commands[device_id] = command
+    with device_commands_queued:
+        device_commands_queued.notify_all()
+    app.logger.debug('Command queued: %s', command)
+
+def control_valve_internal(device_id, state, is_manual=False, conn=None):
+    """Internal function to control valve and log action.
 
-def control_valve_internal(device_id, state, is_manual=False):
-    """Internal function to control valve and log action."""
+    When conn is given the insert joins the caller's transaction instead of
+    committing: errors are raised so the caller rolls back, and the caller
+    updates last_valve_states once it has committed. Returns True if an action
+    was logged.
+    """
+    logged = False
     try:
-        print(f"\nControlling valve for device {device_id}: {'ON' if state else 'OFF'} (Manual: {is_manual})")
-        # Store valve action in database
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO valve_actions (device_id, state) VALUES (?, ?)',
-            (device_id, state)
-        )
-        conn.commit()
-        conn.close()
-        
-        # Queue command for device
-        device_commands[device_id] = 'valve:' + str(state)
-        print(f"Command queued: {device_commands[device_id]}")
-    except Exception as e:
-        print(f"Error controlling valve: {str(e)}")
+        app.logger.debug('Controlling valve for device %s: %s (Manual: %s)', device_id, 'ON' if state else 'OFF', is_manual)
+        # Automation repeats the same command on every reading, only log actual changes
+        if is_manual or get_last_valve_state(device_id) != state:
+            # Store valve action in database
+            db = conn or get_db()
+            db.execute(SQL_INSERT_VALVE_ACTION, (device_id, state))
+            logged = True
+            if conn is None:
+                db.commit()
+                last_valve_states[device_id] = state
+    except Exception:
+        if conn is not None:
+            raise
+        app.logger.exception('Error controlling valve')
+        rollback_thread_transaction()
+        return False
+    
+    queue_valve_command(device_id, state)
+    return logged
+
+def finish_watering_cycle(device_id):
+    """Close the valve at the end of a watering cycle and record the cycle."""
+    app.logger.info('Watering cycle complete for device %s', device_id)
+    # Log the valve-off and the cycle in a single commit
+    conn = get_db()
+    try:
+        with conn:
+            logged = control_valve_internal(device_id, 0, is_manual=False, conn=conn)
+            update_watering_state(device_id, conn=conn)
+    except Exception:
+        # Nothing was recorded, but the valve still has to close
+        queue_valve_command(device_id, 0)
+        raise
+    if logged:
+        last_valve_states[device_id] = 0
 
 @app.route('/api/automation/control', methods=['POST'])
 def control_automation():
     """Endpoint to enable/disable automation."""
     try:
         data = request.json
-        print(f"\nReceived automation control request: {data}")  # Debug log
+        app.logger.debug('Received automation control request: %s', data)
         
         if not data or 'device_id' not in data or 'enabled' not in data:
-            print("Invalid data format")  # Debug log
+            app.logger.debug('Invalid data format')
             return jsonify({'error': 'Invalid data format'}), 400
         
         device_id = data['device_id']
         enabled = int(data['enabled'])  # 0 for disabled, 1 for enabled
-        print(f"Setting automation for device {device_id} to: {'enabled' if enabled else 'disabled'}")  # Debug log
+        app.logger.debug('Setting automation for device %s to: %s', device_id, 'enabled' if enabled else 'disabled')
         
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
-        # Update automation state
-        cursor.execute(
-            'UPDATE automation_rules SET enabled = ? WHERE device_id = ?',
-            (enabled, device_id)
-        )
-        
-        if cursor.rowcount == 0:
-            print(f"No existing rule found for device {device_id}, creating new rule")  # Debug log
-            # If no rule exists, create one with default values
+        # Update automation state, creating a rule with default thresholds if none exists
+        upsert = '''INSERT INTO automation_rules 
+               (device_id, enabled, low_threshold, high_threshold) 
+               VALUES (?, ?, 30.0, 70.0)
+               ON CONFLICT(device_id) DO UPDATE SET enabled = excluded.enabled'''
+        if SQLITE_HAS_RETURNING:
+            # Read back the stored state from the same statement
+            cursor.execute(upsert + ' RETURNING enabled', (device_id, enabled))
+            result = cursor.fetchone()
+        else:
+            cursor.execute(upsert, (device_id, enabled))
             cursor.execute(
-                '''INSERT INTO automation_rules 
-                   (device_id, enabled, low_threshold, high_threshold) 
-                   VALUES (?, ?, 30.0, 70.0)''',
-                (device_id, enabled)
+                'SELECT enabled FROM automation_rules WHERE device_id = ?',
+                (device_id,)
             )
+            result = cursor.fetchone()
         
         conn.commit()
+        with automation_rules_lock:
+            automation_rules_cache.pop(device_id, None)
         
-        # Verify the change
-        cursor.execute(
-            'SELECT enabled FROM automation_rules WHERE device_id = ?',
-            (device_id,)
-        )
-        result = cursor.fetchone()
         current_state = result[0] if result else None
-        print(f"Verified automation state: {current_state}")  # Debug log
-        
-        conn.close()
+        app.logger.debug('Verified automation state: %s', current_state)
         
         return jsonify({
             'status': 'success',
             'enabled': current_state
         }), 200
     except Exception as e:
-        print(f"Error in control_automation: {str(e)}")  # Debug log
+        app.logger.error('Error in control_automation: %s', e)
         return jsonify({'error': str(e)}), 500
 
-def automation_worker():
-    """Background worker to periodically check automation rules."""
-    while True:
-        try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            # Get all devices with recent moisture data
-            cursor.execute('''
-                SELECT DISTINCT device_id FROM moisture_data
-                WHERE timestamp >= datetime('now', '-1 hour')
-            ''')
-            
-            devices = [row['device_id'] for row in cursor.fetchall()]
-            
-            for device_id in devices:
-                # Get device profile for sensing interval
-                profile = get_device_profile(device_id)
-                sensing_interval = profile.get('sensing_interval', DEFAULT_SENSING_INTERVAL)
-                
-                # Get latest moisture reading
-                cursor.execute('''
-                    SELECT moisture FROM moisture_data
-                    WHERE device_id = ?
-                    ORDER BY timestamp DESC LIMIT 1
-                ''', (device_id,))
-                
-                row = cursor.fetchone()
-                if row:
-                    moisture = row['moisture']
-                    check_automation_rules(device_id, moisture)
-            
-            conn.close()
-        except Exception as e:
-            print(f"Error in automation worker: {str(e)}")
+# Housekeeping jobs run on the shared scheduler. Automation itself is driven
+# by receive_sensor_data, which checks the rules for every reading.
+DB_MAINTENANCE_INTERVAL = 3600   # seconds between WAL truncation and vacuum passes
+DB_VACUUM_PAGES = 1000           # free pages returned to the filesystem per pass
+WAL_CHECKPOINT_INTERVAL = 30     # seconds between passive WAL checkpoints
+
+def wal_checkpoint_job():
+    """Scheduled job: copy committed WAL pages into the database, then schedule the next one."""
+    try:
+        # PASSIVE never waits on readers or writers, pages still in use are left for the next pass
+        get_db().execute('PRAGMA wal_checkpoint(PASSIVE)').fetchall()
+    except Exception:
+        app.logger.exception('Error checkpointing WAL')
+    schedule_job(WAL_CHECKPOINT_INTERVAL, wal_checkpoint_job)
+
+def run_db_maintenance(conn):
+    """Truncate the WAL file and release free pages so the database stays compact."""
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.execute(f'PRAGMA incremental_vacuum({DB_VACUUM_PAGES})').fetchall()
+
+def db_maintenance_job():
+    """Scheduled job: run database maintenance, then schedule the next pass."""
+    try:
+        run_db_maintenance(get_db())
+    except Exception:
+        app.logger.exception('Error in database maintenance')
+    schedule_job(DB_MAINTENANCE_INTERVAL, db_maintenance_job)
+
+def reset_daily_cycles():
+    """Scheduled job: zero cycle counts left over from earlier days, then rerun at the next local midnight."""
+    current_time = time.time()
+    today = local_date(current_time)
+    conn = get_db()
+    try:
+        conn.execute(SQL_RESET_DAILY_CYCLES, (today, today))
+        conn.commit()
+    except Exception:
+        app.logger.exception('Error resetting daily cycles')
+        conn.rollback()
+    # local_date() just cached today's bounds, a second of slack lands after midnight
+    schedule_job(_local_day[1] - current_time + 1, reset_daily_cycles)
+
+# Process that started the background threads. Threads do not survive a
+# fork, so a server that imports the app before forking workers gets them
+# started again in each worker.
+_background_pid = None
+_background_lock = threading.Lock()
+
+def start_background_workers():
+    """Start the scheduler and sensor flusher threads once per process."""
+    global _background_pid
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+        
+        threading.Thread(target=scheduler_worker, daemon=True).start()
+        threading.Thread(target=sensor_flusher, daemon=True).start()
+        # Flush whatever is left on shutdown
+        atexit.register(flush_sensor_readings)
         
-        # Sleep for minimum sensing interval (we'll check each device's specific interval)
-        time.sleep(60)  # Check every minute
+        # Start the housekeeping jobs, resetting stale counters right away
+        schedule_job(0, reset_daily_cycles)
+        schedule_job(WAL_CHECKPOINT_INTERVAL, wal_checkpoint_job)
+        schedule_job(DB_MAINTENANCE_INTERVAL, db_maintenance_job)
 
-# Start automation worker thread
-automation_thread = threading.Thread(target=automation_worker)
-automation_thread.daemon = True
-automation_thread.start()
+# Servers that don't start the workers themselves get them on the first request
+@app.before_request
+def ensure_background_workers():
+    if _background_pid != os.getpid():
+        start_background_workers()
 
 @app.route('/api/measurements', methods=['POST'])
 def add_measurement():
@@ -725,96 +1494,93 @@ def add_measurement():
         fertilized = data.get('fertilized', False)
         pruned = data.get('pruned', False)
 
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO plant_measurements (
-                device_id, plant_name, height, leaf_count, stem_thickness, canopy_width,
-                leaf_color, leaf_firmness, notes, fertilized, pruned
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        cursor.execute(SQL_INSERT_MEASUREMENT, (
             device_id, plant_name, height, leaf_count, stem_thickness, canopy_width,
             leaf_color, leaf_firmness, notes, fertilized, pruned
         ))
         
         conn.commit()
-        conn.close()
         
         return jsonify({'status': 'success', 'id': cursor.lastrowid}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/measurements/batch', methods=['POST'])
+def add_measurements_batch():
+    """Endpoint to add a list of plant measurements in one transaction."""
+    try:
+        data = request.json
+        if not isinstance(data, list) or not data:
+            return jsonify({'error': 'A list of measurements is required'}), 400
+        
+        rows = []
+        for index, m in enumerate(data):
+            if not isinstance(m, dict) or 'device_id' not in m:
+                return jsonify({'error': f'Device ID is required (measurement {index})'}), 400
+            rows.append((
+                m['device_id'], m.get('plant_name', 'My Plant'), m.get('height'),
+                m.get('leaf_count'), m.get('stem_thickness'), m.get('canopy_width'),
+                m.get('leaf_color'), m.get('leaf_firmness'), m.get('notes'),
+                m.get('fertilized', False), m.get('pruned', False)
+            ))
+        
+        conn = get_db()
+        with conn:
+            conn.executemany(SQL_INSERT_MEASUREMENT, rows)
+        
+        return jsonify({'status': 'success', 'inserted': len(rows)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/measurements/<device_id>', methods=['GET'])
 def get_measurements(device_id):
     """Endpoint to retrieve plant measurements."""
     try:
         days = request.args.get('days', 30, type=int)
         
-        # Calculate timestamp for filtering
-        timestamp = datetime.datetime.now() - datetime.timedelta(days=days)
-        timestamp_str = timestamp.strftime('%Y-%m-%d %H:%M:%S')
+        # SQLite works out the cutoff, in the same UTC text format CURRENT_TIMESTAMP stores
+        cutoff = f'-{days} days'
         
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_read_db()
         cursor = conn.cursor()
         
         cursor.execute('''
             SELECT * FROM plant_measurements 
-            WHERE device_id = ? AND timestamp >= ?
+            WHERE device_id = ? AND timestamp >= datetime('now', ?)
             ORDER BY timestamp DESC
-        ''', (device_id, timestamp_str))
-        
-        rows = cursor.fetchall()
-        measurements = [dict(row) for row in rows]
-        conn.close()
+        ''', (device_id, cutoff))
         
-        return jsonify(measurements), 200
+        return stream_json_rows(cursor)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/measurements/<int:measurement_id>', methods=['PUT', 'DELETE', 'GET', 'OPTIONS'])
+@app.route('/api/measurements/<int:measurement_id>', methods=['PUT', 'DELETE', 'GET'])
 def handle_measurement(measurement_id):
     """Handle all operations for a specific measurement."""
-    # Handle preflight requests
-    if request.method == 'OPTIONS':
-        return '', 204
-        
-    elif request.method == 'DELETE':
+    if request.method == 'DELETE':
         try:
-            conn = sqlite3.connect(DB_PATH)
+            conn = get_db()
             cursor = conn.cursor()
             
-            # Check if measurement exists
-            cursor.execute('SELECT id FROM plant_measurements WHERE id = ?', (measurement_id,))
-            if not cursor.fetchone():
-                if 'conn' in locals():
-                    conn.close()
-                return jsonify({'error': 'Measurement not found'}), 404
-                
-            # Delete associated photos first
-            cursor.execute('SELECT file_path FROM plant_photos WHERE measurement_id = ?', (measurement_id,))
-            photos = cursor.fetchall()
-            
-            # Delete photo files
-            for photo in photos:
-                try:
-                    if os.path.exists(photo[0]):
-                        os.remove(photo[0])
-                except Exception as e:
-                    print(f"Error deleting photo file: {str(e)}")
-            
-            # Delete the measurement and associated photos (cascade delete will handle photos table)
+            # Delete the measurement and its photo rows (foreign keys are not enforced, so no cascade)
+            file_paths = delete_photo_rows(cursor, 'measurement_id = ?', (measurement_id,))
             cursor.execute('DELETE FROM plant_measurements WHERE id = ?', (measurement_id,))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return jsonify({'error': 'Measurement not found'}), 404
             conn.commit()
-            conn.close()
+            cache_drop(photos_cache, measurement_id)
+            
+            # Remove the files only once the rows are gone
+            remove_photo_files(file_paths)
             
             return jsonify({'status': 'success', 'message': 'Measurement deleted'}), 200
             
-        except Exception as e:
-            print(f"Error deleting measurement: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
+        except Exception:
+            app.logger.exception('Error deleting measurement')
             return jsonify({'error': 'Internal server error'}), 500
             
     elif request.method == 'PUT':
@@ -825,89 +1591,36 @@ def handle_measurement(measurement_id):
             if not data:
                 return jsonify({'error': 'No data provided'}), 400
 
-            # Get the existing measurement
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM plant_measurements WHERE id = ?', (measurement_id,))
-            existing = cursor.fetchone()
+            # Only fields present in the request change. Each field binds a
+            # "present" flag and a value so one cached statement covers every subset.
+            if not any(field in data for field in MEASUREMENT_UPDATE_FIELDS):
+                return jsonify({'error': 'No fields to update'}), 400
             
-            if not existing:
-                return jsonify({'error': 'Measurement not found'}), 404
-
-            # Update the measurement
-            update_fields = []
             update_values = []
-            
-            # Only update fields that are provided
-            if 'plant_name' in data:
-                update_fields.append('plant_name = ?')
-                update_values.append(data['plant_name'])
-            if 'height' in data:
-                update_fields.append('height = ?')
-                update_values.append(data['height'])
-            if 'leaf_count' in data:
-                update_fields.append('leaf_count = ?')
-                update_values.append(data['leaf_count'])
-            if 'stem_thickness' in data:
-                update_fields.append('stem_thickness = ?')
-                update_values.append(data['stem_thickness'])
-            if 'canopy_width' in data:
-                update_fields.append('canopy_width = ?')
-                update_values.append(data['canopy_width'])
-            if 'leaf_color' in data:
-                update_fields.append('leaf_color = ?')
-                update_values.append(data['leaf_color'])
-            if 'leaf_firmness' in data:
-                update_fields.append('leaf_firmness = ?')
-                update_values.append(data['leaf_firmness'])
-            if 'notes' in data:
-                update_fields.append('notes = ?')
-                update_values.append(data['notes'])
-            if 'fertilized' in data:
-                update_fields.append('fertilized = ?')
-                update_values.append(1 if data['fertilized'] else 0)
-            if 'pruned' in data:
-                update_fields.append('pruned = ?')
-                update_values.append(1 if data['pruned'] else 0)
-                
-            if not update_fields:
-                return jsonify({'error': 'No fields to update'}), 400
-                
-            # Add measurement_id to values for WHERE clause
+            for field in MEASUREMENT_UPDATE_FIELDS:
+                value = data.get(field)
+                if field in ('fertilized', 'pruned'):
+                    value = 1 if value else 0
+                update_values.extend((field in data, value))
             update_values.append(measurement_id)
             
-            # Construct and execute update query
-            query = f'''
-                UPDATE plant_measurements 
-                SET {', '.join(update_fields)}
-                WHERE id = ?
-            '''
-            
-            cursor.execute(query, update_values)
+            conn = get_db()
+            cursor = conn.cursor()
+            updated = write_row_returning(cursor, SQL_UPDATE_MEASUREMENT, update_values, 'plant_measurements', measurement_id)
+            if updated is None:
+                conn.rollback()
+                return jsonify({'error': 'Measurement not found'}), 404
             conn.commit()
             
             # Return updated measurement
-            cursor.execute('SELECT * FROM plant_measurements WHERE id = ?', (measurement_id,))
-            updated = cursor.fetchone()
+            updated = dict(updated)
+            updated['fertilized'] = bool(updated['fertilized'])
+            updated['pruned'] = bool(updated['pruned'])
             
-            return jsonify({
-                'id': updated[0],
-                'device_id': updated[1],
-                'timestamp': updated[2],
-                'plant_name': updated[3],
-                'height': updated[4],
-                'leaf_count': updated[5],
-                'stem_thickness': updated[6],
-                'canopy_width': updated[7],
-                'leaf_color': updated[8],
-                'leaf_firmness': updated[9],
-                'notes': updated[10],
-                'fertilized': bool(updated[11]),
-                'pruned': bool(updated[12])
-            })
+            return jsonify(updated)
             
-        except Exception as e:
-            print(f"Error updating measurement: {str(e)}")
+        except Exception:
+            app.logger.exception('Error updating measurement')
             return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/measurements/<int:measurement_id>/photos', methods=['POST'])
@@ -915,7 +1628,7 @@ def upload_photo(measurement_id):
     """Upload a photo for a specific measurement."""
     try:
         # Check if measurement exists
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('SELECT id FROM plant_measurements WHERE id = ?', (measurement_id,))
         if not cursor.fetchone():
@@ -929,25 +1642,33 @@ def upload_photo(measurement_id):
             return jsonify({'error': 'No selected file'}), 400
 
         if photo and allowed_file(photo.filename):
-            # Secure the filename and create unique filename
-            filename = secure_filename(photo.filename)
-            base_name, extension = os.path.splitext(filename)
-            timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-            unique_filename = f"{base_name}_{timestamp}{extension}"
+            # The upload was spooled to the uploads folder and hashed while parsing
+            upload = photo.stream
+            upload.close()
             
-            # Save the file
+            # Name the file after its content, identical uploads share one file
+            extension = os.path.splitext(photo.filename)[1].lower()
+            unique_filename = upload.digest.hexdigest() + extension
             file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-            photo.save(file_path)
+            mime_type = mimetypes.guess_type(unique_filename)[0]
             
-            # Store file info in database
-            cursor.execute('''
-                INSERT INTO plant_photos (measurement_id, filename, file_path)
-                VALUES (?, ?, ?)
-            ''', (measurement_id, unique_filename, file_path))
-            
-            conn.commit()
+            # Reusing the file and committing the row that references it must not
+            # interleave with a background unlink of the same file
+            with photo_files_lock:
+                if os.path.exists(file_path):
+                    os.remove(upload.name)
+                else:
+                    os.replace(upload.name, file_path)
+                
+                # Store file info in database
+                cursor.execute('''
+                    INSERT INTO plant_photos (measurement_id, filename, file_path, mime_type)
+                    VALUES (?, ?, ?, ?)
+                ''', (measurement_id, unique_filename, file_path, mime_type))
+                
+                conn.commit()
+            cache_drop(photos_cache, measurement_id)
             photo_id = cursor.lastrowid
-            conn.close()
             
             return jsonify({
                 'status': 'success',
@@ -957,16 +1678,21 @@ def upload_photo(measurement_id):
         
         return jsonify({'error': 'Invalid file type'}), 400
         
-    except Exception as e:
-        print(f"Error uploading photo: {str(e)}")
+    except RequestEntityTooLarge:
+        return jsonify({'error': 'Photo is too large'}), 413
+    except Exception:
+        app.logger.exception('Error uploading photo')
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/measurements/<int:measurement_id>/photos', methods=['GET'])
 def get_photos(measurement_id):
     """Get all photos for a specific measurement."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        photos = cache_get(photos_cache, measurement_id)
+        if photos is not None:
+            return jsonify(photos), 200
+        
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -977,115 +1703,98 @@ def get_photos(measurement_id):
         ''', (measurement_id,))
         
         rows = cursor.fetchall()
-        photos = [dict(row) for row in rows]
-        conn.close()
+        photos = cache_put(photos_cache, measurement_id, [dict(row) for row in rows])
         
         return jsonify(photos), 200
         
-    except Exception as e:
-        print(f"Error getting photos: {str(e)}")
+    except Exception:
+        app.logger.exception('Error getting photos')
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/photos/<int:photo_id>', methods=['GET'])
 def get_photo(photo_id):
     """Get a specific photo by ID."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('SELECT file_path FROM plant_photos WHERE id = ?', (photo_id,))
+        cursor.execute('SELECT file_path, mime_type FROM plant_photos WHERE id = ?', (photo_id,))
         result = cursor.fetchone()
-        conn.close()
         
         if not result:
             return jsonify({'error': 'Photo not found'}), 404
-            
-        return send_file(result[0], mimetype='image/jpeg')
         
-    except Exception as e:
-        print(f"Error retrieving photo: {str(e)}")
+        mime_type = result[1] or mimetypes.guess_type(result[0])[0] or 'image/jpeg'
+        if PHOTO_ACCEL_REDIRECT and os.path.dirname(result[0]) == UPLOAD_FOLDER:
+            # nginx serves the file itself, including its own ETag and range handling
+            response = app.response_class(mimetype=mime_type)
+            response.headers['X-Accel-Redirect'] = PHOTO_ACCEL_REDIRECT + os.path.basename(result[0])
+            response.cache_control.max_age = PHOTO_CACHE_MAX_AGE
+            return response
+        
+        # ETag and Last-Modified come from the file, so repeat views get a 304
+        return send_file(result[0], mimetype=mime_type, conditional=True, etag=True,
+                         max_age=PHOTO_CACHE_MAX_AGE)
+        
+    except Exception:
+        app.logger.exception('Error retrieving photo')
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/photos/<int:photo_id>', methods=['DELETE'])
 def delete_photo(photo_id):
     """Delete a specific photo."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
-        # Get file path before deleting record
-        cursor.execute('SELECT file_path FROM plant_photos WHERE id = ?', (photo_id,))
-        result = cursor.fetchone()
-        
-        if not result:
+        # Delete the record and get its file path in the same statement
+        file_paths = delete_photo_rows(cursor, 'id = ?', (photo_id,))
+        if not file_paths:
+            conn.rollback()
             return jsonify({'error': 'Photo not found'}), 404
-            
-        file_path = result[0]
-        
-        # Delete database record
-        cursor.execute('DELETE FROM plant_photos WHERE id = ?', (photo_id,))
         conn.commit()
-        conn.close()
+        cache_drop(photos_cache, everything=True)
         
-        # Delete actual file
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # Delete actual file unless another photo shares it
+        remove_photo_files(file_paths)
         
         return jsonify({'status': 'success', 'message': 'Photo deleted'}), 200
         
-    except Exception as e:
-        print(f"Error deleting photo: {str(e)}")
+    except Exception:
+        app.logger.exception('Error deleting photo')
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/plants/<device_id>/<plant_name>', methods=['DELETE', 'OPTIONS'])
+@app.route('/api/plants/<device_id>/<plant_name>', methods=['DELETE'])
 def delete_plant(device_id, plant_name):
     """Delete all measurements for a specific plant."""
-    if request.method == 'OPTIONS':
-        return '', 204
-        
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
-        # Get all measurements for this plant
-        cursor.execute('''
-            SELECT id FROM plant_measurements 
-            WHERE device_id = ? AND plant_name = ?
-        ''', (device_id, plant_name))
-        measurements = cursor.fetchall()
-        
-        # Delete photos for each measurement
-        for measurement in measurements:
-            measurement_id = measurement[0]
-            cursor.execute('SELECT file_path FROM plant_photos WHERE measurement_id = ?', (measurement_id,))
-            photos = cursor.fetchall()
-            
-            # Delete photo files
-            for photo in photos:
-                try:
-                    if os.path.exists(photo[0]):
-                        os.remove(photo[0])
-                except Exception as e:
-                    print(f"Error deleting photo file: {str(e)}")
-        
-        # Delete all measurements for this plant (cascade delete will handle photos)
+        # Delete the photo rows and measurements together (foreign keys are not enforced, so no cascade)
+        file_paths = delete_photo_rows(
+            cursor,
+            'measurement_id IN (SELECT id FROM plant_measurements WHERE device_id = ? AND plant_name = ?)',
+            (device_id, plant_name)
+        )
         cursor.execute('''
             DELETE FROM plant_measurements 
             WHERE device_id = ? AND plant_name = ?
         ''', (device_id, plant_name))
         
         conn.commit()
-        conn.close()
+        cache_drop(photos_cache, everything=True)
+        
+        # Remove the files only once the rows are gone
+        remove_photo_files(file_paths)
         
         return jsonify({
             'status': 'success',
             'message': f'Plant profile {plant_name} deleted successfully'
         }), 200
         
-    except Exception as e:
-        print(f"Error deleting plant profile: {str(e)}")
-        if 'conn' in locals():
-            conn.close()
+    except Exception:
+        app.logger.exception('Error deleting plant profile')
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/zones', methods=['GET'])
@@ -1093,55 +1802,54 @@ def get_zones():
     """Get all garden zones."""
     try:
         app.logger.info("Handling GET request to /api/zones")
-        conn = sqlite3.connect(DB_PATH)
+        result = cache_get(zones_cache, None)
+        if result is not None:
+            return jsonify(result), 200
+        
+        conn = get_db()
         cursor = conn.cursor()
         
-        # First check if the zones table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='zones'")
-        if not cursor.fetchone():
-            app.logger.error("Zones table does not exist!")
-            return jsonify({'error': 'Zones table not initialized'}), 500
-            
-            # Get all zones
-        cursor.execute('SELECT * FROM zones ORDER BY created_at DESC')
-        zones = cursor.fetchall()
-        app.logger.info(f"Found {len(zones)} zones")
-        
-        result = []
-        for zone in zones:
-            zone_data = {
-                'id': zone[0],
-                'name': zone[1],
-                'description': zone[2],
-                'device_id': zone[3],
-                'width': zone[4],
-                'length': zone[5],
-                'created_at': zone[6],
-                'updated_at': zone[7]
-            }
-            
-            # Get plants for this zone
-            cursor.execute('SELECT * FROM plants WHERE zone_id = ?', (zone[0],))
-            plants = cursor.fetchall()
-            zone_data['plants'] = [{
-                'id': plant[0],
-                'name': plant[2],
-                'species': plant[3],
-                'planting_date': plant[4],
-                'position_x': plant[5],
-                'position_y': plant[6],
-                'notes': plant[7],
-                'water_requirements': plant[8]
-            } for plant in plants]
-            
-            result.append(zone_data)
+        # Get all zones with their plants in one query, zones without plants get a NULL plant row
+        cursor.execute('''
+            SELECT z.id, z.name, z.description, z.device_id, z.width, z.length, z.created_at, z.updated_at,
+                   p.id, p.name, p.species, p.planting_date, p.position_x, p.position_y, p.notes, p.water_requirements
+            FROM zones z LEFT JOIN plants p ON p.zone_id = z.id
+            ORDER BY z.created_at DESC, z.id, p.id
+        ''')
+        
+        zones = {}
+        for row in cursor.fetchall():
+            zone_data = zones.get(row[0])
+            if zone_data is None:
+                zone_data = zones[row[0]] = {
+                    'id': row[0],
+                    'name': row[1],
+                    'description': row[2],
+                    'device_id': row[3],
+                    'width': row[4],
+                    'length': row[5],
+                    'created_at': row[6],
+                    'updated_at': row[7],
+                    'plants': []
+                }
+            if row[8] is not None:
+                zone_data['plants'].append({
+                    'id': row[8],
+                    'name': row[9],
+                    'species': row[10],
+                    'planting_date': row[11],
+                    'position_x': row[12],
+                    'position_y': row[13],
+                    'notes': row[14],
+                    'water_requirements': row[15]
+                })
+        
+        result = cache_put(zones_cache, None, list(zones.values()))
+        app.logger.info(f"Found {len(result)} zones")
         
-        conn.close()
         return jsonify(result), 200
     except Exception as e:
         app.logger.error(f"Error in get_zones: {str(e)}")
-        if 'conn' in locals():
-            conn.close()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/zones', methods=['POST'])
@@ -1157,15 +1865,9 @@ def create_zone():
             app.logger.error("Missing required fields")
             return jsonify({'error': 'Missing required fields'}), 400
         
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
-        # First check if the zones table exists
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='zones'")
-        if not cursor.fetchone():
-            app.logger.error("Zones table does not exist!")
-            return jsonify({'error': 'Zones table not initialized'}), 500
-        
         cursor.execute('''
             INSERT INTO zones (name, description, device_id, width, length)
             VALUES (?, ?, ?, ?, ?)
@@ -1180,20 +1882,18 @@ def create_zone():
         zone_id = cursor.lastrowid
         app.logger.info(f"Created zone with ID: {zone_id}")
         conn.commit()
-        conn.close()
+        cache_drop(zones_cache, everything=True)
         
         return jsonify({'id': zone_id, 'status': 'success'}), 201
     except Exception as e:
         app.logger.error(f"Error in create_zone: {str(e)}")
-        if 'conn' in locals():
-            conn.close()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/zones/<int:zone_id>', methods=['GET', 'PUT', 'DELETE'])
 def manage_zone(zone_id):
     """Manage a specific garden zone."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
         if request.method == 'GET':
@@ -1203,30 +1903,14 @@ def manage_zone(zone_id):
             if not zone:
                 return jsonify({'error': 'Zone not found'}), 404
             
-            result = {
-                'id': zone[0],
-                'name': zone[1],
-                'description': zone[2],
-                'device_id': zone[3],
-                'width': zone[4],
-                'length': zone[5],
-                'created_at': zone[6],
-                'updated_at': zone[7]
-            }
+            result = dict(zone)
             
             # Get plants in this zone
-            cursor.execute('SELECT * FROM plants WHERE zone_id = ?', (zone_id,))
-            plants = cursor.fetchall()
-            result['plants'] = [{
-                'id': plant[0],
-                'name': plant[2],
-                'species': plant[3],
-                'planting_date': plant[4],
-                'position_x': plant[5],
-                'position_y': plant[6],
-                'notes': plant[7],
-                'water_requirements': plant[8]
-            } for plant in plants]
+            cursor.execute('''
+                SELECT id, name, species, planting_date, position_x, position_y, notes, water_requirements
+                FROM plants WHERE zone_id = ?
+            ''', (zone_id,))
+            result['plants'] = [dict(plant) for plant in cursor.fetchall()]
             
             return jsonify(result), 200
             
@@ -1252,7 +1936,7 @@ def manage_zone(zone_id):
             cursor.execute('DELETE FROM zones WHERE id = ?', (zone_id,))
         
         conn.commit()
-        conn.close()
+        cache_drop(zones_cache, everything=True)
         return jsonify({'status': 'success'}), 200
         
     except Exception as e:
@@ -1264,39 +1948,16 @@ def manage_zone_plants(zone_id):
     try:
         app.logger.info(f"Handling {request.method} request to /api/zones/{zone_id}/plants")
         
-        # First check if the database exists
-        if not os.path.exists(DB_PATH):
-            app.logger.error(f"Database file does not exist at {DB_PATH}")
-            return jsonify({'error': 'Database not initialized'}), 500
-            
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
         if request.method == 'GET':
             app.logger.info(f"Fetching plants for zone {zone_id}")
             
-            # Check if plants table exists
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='plants'")
-            if not cursor.fetchone():
-                app.logger.error("Plants table does not exist in database")
-                return jsonify({'error': 'Plants table not initialized'}), 500
-            
             cursor.execute('SELECT * FROM plants WHERE zone_id = ?', (zone_id,))
             plants = cursor.fetchall()
             
-            result = [{
-                'id': plant[0],
-                'zone_id': plant[1],
-                'name': plant[2],
-                'species': plant[3],
-                'planting_date': plant[4],
-                'position_x': plant[5],
-                'position_y': plant[6],
-                'notes': plant[7],
-                'water_requirements': plant[8],
-                'created_at': plant[9],
-                'updated_at': plant[10]
-            } for plant in plants]
+            result = [dict(plant) for plant in plants]
             
             app.logger.info(f"Found {len(plants)} plants")
             return jsonify(result), 200
@@ -1311,20 +1972,15 @@ def manage_zone_plants(zone_id):
                 app.logger.error(f"Missing required fields: {missing_fields}")
                 return jsonify({'error': f'Missing required fields: {missing_fields}'}), 400
             
-            # Check if plants table exists
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='plants'")
-            if not cursor.fetchone():
-                app.logger.error("Plants table does not exist in database")
-                return jsonify({'error': 'Plants table not initialized'}), 500
-            
             # Check if zone exists
+            begin_write(conn)
             cursor.execute('SELECT id FROM zones WHERE id = ?', (zone_id,))
             if not cursor.fetchone():
                 app.logger.error(f"Zone {zone_id} does not exist")
                 return jsonify({'error': 'Zone not found'}), 404
             
             try:
-                cursor.execute('''
+                plant = write_row_returning(cursor, '''
                     INSERT INTO plants (
                         zone_id, name, species, planting_date, 
                         position_x, position_y, notes, water_requirements
@@ -1339,22 +1995,17 @@ def manage_zone_plants(zone_id):
                     data['position_y'],
                     data.get('notes'),
                     data.get('water_requirements')
-                ))
+                ), 'plants')
             except sqlite3.Error as e:
                 app.logger.error(f"Database error while inserting plant: {str(e)}")
                 return jsonify({'error': f'Database error: {str(e)}'}), 500
             
-            plant_id = cursor.lastrowid
+            plant_id = plant['id']
             app.logger.info(f"Created plant with ID: {plant_id}")
             
             # Add planting event to history
             try:
-                cursor.execute('''
-                    INSERT INTO zone_history (
-                        zone_id, plant_id, event_type, event_description
-                    )
-                    VALUES (?, ?, ?, ?)
-                ''', (
+                cursor.execute(SQL_INSERT_ZONE_HISTORY, (
                     zone_id,
                     plant_id,
                     'planting',
@@ -1365,57 +2016,34 @@ def manage_zone_plants(zone_id):
                 # Continue even if history event fails
             
             conn.commit()
+            cache_drop(zones_cache, everything=True)
             
             # Return the created plant
-            cursor.execute('SELECT * FROM plants WHERE id = ?', (plant_id,))
-            plant = cursor.fetchone()
-            result = {
-                'id': plant[0],
-                'zone_id': plant[1],
-                'name': plant[2],
-                'species': plant[3],
-                'planting_date': plant[4],
-                'position_x': plant[5],
-                'position_y': plant[6],
-                'notes': plant[7],
-                'water_requirements': plant[8],
-                'created_at': plant[9],
-                'updated_at': plant[10]
-            }
+            result = dict(plant)
             
-            conn.close()
             return jsonify(result), 201
             
     except Exception as e:
         app.logger.error(f"Error in manage_zone_plants: {str(e)}", exc_info=True)
-        if 'conn' in locals():
-            conn.close()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/zones/<int:zone_id>/history', methods=['GET', 'POST'])
 def zone_history(zone_id):
     """Manage zone history and events."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
         if request.method == 'GET':
             cursor.execute('''
-                SELECT h.*, p.name as plant_name 
+                SELECT h.id, h.event_type, h.event_description, h.timestamp, p.name as plant_name 
                 FROM zone_history h 
                 LEFT JOIN plants p ON h.plant_id = p.id 
                 WHERE h.zone_id = ? 
                 ORDER BY h.timestamp DESC
             ''', (zone_id,))
-            history = cursor.fetchall()
             
-            result = [{
-                'id': event[0],
-                'event_type': event[3],
-                'event_description': event[4],
-                'timestamp': event[5],
-                'plant_name': event[6]
-            } for event in history]
+            result = [dict(event) for event in cursor.fetchall()]
             
             return jsonify(result), 200
             
@@ -1425,12 +2053,7 @@ def zone_history(zone_id):
             if not all(field in data for field in required_fields):
                 return jsonify({'error': 'Missing required fields'}), 400
             
-            cursor.execute('''
-                INSERT INTO zone_history (
-                    zone_id, plant_id, event_type, event_description
-                )
-                VALUES (?, ?, ?, ?)
-            ''', (
+            cursor.execute(SQL_INSERT_ZONE_HISTORY, (
                 zone_id,
                 data.get('plant_id'),
                 data['event_type'],
@@ -1439,7 +2062,6 @@ def zone_history(zone_id):
             
             event_id = cursor.lastrowid
             conn.commit()
-            conn.close()
             return jsonify({'id': event_id, 'status': 'success'}), 201
             
     except Exception as e:
@@ -1449,25 +2071,17 @@ def zone_history(zone_id):
 def manage_plant(zone_id, plant_id):
     """Manage a specific plant."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
-        # Check if plant exists and belongs to the zone
-        cursor.execute(
-            'SELECT id FROM plants WHERE id = ? AND zone_id = ?',
-            (plant_id, zone_id)
-        )
-        if not cursor.fetchone():
-            conn.close()
-            return jsonify({'error': 'Plant not found'}), 404
-        
+        # The plant must exist and belong to the zone, each branch checks as part of its first statement
         if request.method == 'PUT':
             data = request.json
             required_fields = ['name', 'species', 'planting_date', 'position_x', 'position_y']
             if not all(field in data for field in required_fields):
                 return jsonify({'error': 'Missing required fields'}), 400
             
-            cursor.execute('''
+            plant = write_row_returning(cursor, '''
                 UPDATE plants 
                 SET name = ?, species = ?, planting_date = ?, 
                     position_x = ?, position_y = ?, notes = ?, 
@@ -1483,15 +2097,13 @@ def manage_plant(zone_id, plant_id):
                 data.get('water_requirements'),
                 plant_id,
                 zone_id
-            ))
+            ), 'plants', plant_id)
+            if plant is None:
+                conn.rollback()
+                return jsonify({'error': 'Plant not found'}), 404
             
             # Add update event to history
-            cursor.execute('''
-                INSERT INTO zone_history (
-                    zone_id, plant_id, event_type, event_description
-                )
-                VALUES (?, ?, ?, ?)
-            ''', (
+            cursor.execute(SQL_INSERT_ZONE_HISTORY, (
                 zone_id,
                 plant_id,
                 'update',
@@ -1499,53 +2111,35 @@ def manage_plant(zone_id, plant_id):
             ))
             
             conn.commit()
+            cache_drop(zones_cache, everything=True)
             
             # Return updated plant
-            cursor.execute('SELECT * FROM plants WHERE id = ?', (plant_id,))
-            plant = cursor.fetchone()
-            result = {
-                'id': plant[0],
-                'zone_id': plant[1],
-                'name': plant[2],
-                'species': plant[3],
-                'planting_date': plant[4],
-                'position_x': plant[5],
-                'position_y': plant[6],
-                'notes': plant[7],
-                'water_requirements': plant[8],
-                'created_at': plant[9],
-                'updated_at': plant[10]
-            }
+            result = dict(plant)
             
-            conn.close()
             return jsonify(result), 200
             
         elif request.method == 'DELETE':
-            # Add deletion event to history
-            cursor.execute('SELECT name, species FROM plants WHERE id = ?', (plant_id,))
+            begin_write(conn)
+            cursor.execute('SELECT name, species FROM plants WHERE id = ? AND zone_id = ?', (plant_id, zone_id))
             plant = cursor.fetchone()
-            if plant:
-                cursor.execute('''
-                    INSERT INTO zone_history (
-                        zone_id, plant_id, event_type, event_description
-                    )
-                    VALUES (?, ?, ?, ?)
-                ''', (
-                    zone_id,
-                    plant_id,
-                    'deletion',
-                    f"Removed {plant[1]} ({plant[0]})"
-                ))
+            if not plant:
+                return jsonify({'error': 'Plant not found'}), 404
+            
+            # Add deletion event to history
+            cursor.execute(SQL_INSERT_ZONE_HISTORY, (
+                zone_id,
+                plant_id,
+                'deletion',
+                f"Removed {plant[1]} ({plant[0]})"
+            ))
             
             # Delete the plant
             cursor.execute('DELETE FROM plants WHERE id = ? AND zone_id = ?', (plant_id, zone_id))
             conn.commit()
-            conn.close()
+            cache_drop(zones_cache, everything=True)
             return jsonify({'status': 'success'}), 200
             
     except Exception as e:
-        if 'conn' in locals():
-            conn.close()
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/profiles', methods=['GET'])
@@ -1557,8 +2151,11 @@ def get_watering_profiles():
         if not device_id:
             return jsonify({'error': 'Device ID is required'}), 400
         
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        profiles = cache_get(profiles_cache, device_id)
+        if profiles is not None:
+            return jsonify(profiles), 200
+        
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -1567,7 +2164,6 @@ def get_watering_profiles():
         )
         
         profiles = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         
         # If no profiles exist, return the default values
         if not profiles:
@@ -1583,11 +2179,12 @@ def get_watering_profiles():
                 'reservoir_limit': None,
                 'reservoir_volume': None,
                 'max_watering_per_day': None,
-                'created_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'updated_at': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
-            return jsonify([default_profile]), 200
+            profiles = [default_profile]
         
+        cache_put(profiles_cache, device_id, profiles)
         return jsonify(profiles), 200
     except Exception as e:
         app.logger.error(f"Error getting watering profiles: {str(e)}")
@@ -1597,13 +2194,11 @@ def get_watering_profiles():
 def get_profile(profile_id):
     """Endpoint to retrieve a specific watering profile."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM watering_profiles WHERE id = ?', (profile_id,))
         profile = cursor.fetchone()
-        conn.close()
         
         if not profile:
             return jsonify({'error': 'Profile not found'}), 404
@@ -1635,7 +2230,7 @@ def create_watering_profile():
         reservoir_volume = data.get('reservoir_volume')
         max_watering_per_day = data.get('max_watering_per_day')
         
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
         # If this is being set as the default, unset any existing defaults
@@ -1659,7 +2254,6 @@ def create_watering_profile():
         
         profile_id = cursor.lastrowid
         conn.commit()
-        conn.close()
         
         # Remove from cache to force refresh
         refresh_device_profile(device_id)
@@ -1681,15 +2275,15 @@ def update_watering_profile(profile_id):
         if not data:
             return jsonify({'error': 'Invalid data format'}), 400
         
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
         # Get existing profile to get the device_id
+        begin_write(conn)
         cursor.execute('SELECT device_id FROM watering_profiles WHERE id = ?', (profile_id,))
         row = cursor.fetchone()
         
         if not row:
-            conn.close()
             return jsonify({'error': 'Profile not found'}), 404
         
         device_id = row[0]
@@ -1701,38 +2295,16 @@ def update_watering_profile(profile_id):
                 (device_id,)
             )
         
-        # Build update statement dynamically
-        fields = []
+        # Only fields present in the request change, updated_at is always bumped.
+        # Like the measurement update, one cached statement covers every subset.
         params = []
-        
-        update_fields = [
-            'name', 'is_default', 'watering_duration', 'wicking_wait_time',
-            'max_daily_cycles', 'sensing_interval', 'reservoir_limit',
-            'reservoir_volume', 'max_watering_per_day'
-        ]
-        
-        for field in update_fields:
-            if field in data:
-                fields.append(f"{field} = ?")
-                params.append(data[field])
-        
-        # Always update the updated_at timestamp
-        fields.append("updated_at = datetime('now')")
-        
-        if not fields:
-            conn.close()
-            return jsonify({'error': 'No fields to update'}), 400
-        
+        for field in PROFILE_UPDATE_FIELDS:
+            params.extend((field in data, data.get(field)))
         params.append(profile_id)
         
-        # Execute update
-        cursor.execute(
-            f"UPDATE watering_profiles SET {', '.join(fields)} WHERE id = ?",
-            params
-        )
+        cursor.execute(SQL_UPDATE_PROFILE, params)
         
         conn.commit()
-        conn.close()
         
         # Remove from cache to force refresh
         refresh_device_profile(device_id)
@@ -1749,15 +2321,15 @@ def update_watering_profile(profile_id):
 def delete_watering_profile(profile_id):
     """Endpoint to delete a watering profile."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
         # Get device_id before deleting
+        begin_write(conn)
         cursor.execute('SELECT device_id, is_default FROM watering_profiles WHERE id = ?', (profile_id,))
         row = cursor.fetchone()
         
         if not row:
-            conn.close()
             return jsonify({'error': 'Profile not found'}), 404
         
         device_id, is_default = row
@@ -1779,7 +2351,6 @@ def delete_watering_profile(profile_id):
                 )
         
         conn.commit()
-        conn.close()
         
         # Remove from cache to force refresh
         refresh_device_profile(device_id)
@@ -1796,15 +2367,15 @@ def delete_watering_profile(profile_id):
 def set_default_profile(profile_id):
     """Endpoint to set a profile as the default for a device."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_db()
         cursor = conn.cursor()
         
         # Get device_id for the profile
+        begin_write(conn)
         cursor.execute('SELECT device_id FROM watering_profiles WHERE id = ?', (profile_id,))
         row = cursor.fetchone()
         
         if not row:
-            conn.close()
             return jsonify({'error': 'Profile not found'}), 404
         
         device_id = row[0]
@@ -1822,7 +2393,6 @@ def set_default_profile(profile_id):
         )
         
         conn.commit()
-        conn.close()
         
         # Remove from cache to force refresh
         refresh_device_profile(device_id)
@@ -0,0 +1,22 @@
+"""
+Gunicorn configuration for the irrigation control system API.
+Gunicorn picks this file up automatically when started from the backend directory.
+"""
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Device command queues, watering state and the scheduled jobs live in the
+# process, so a single worker keeps them consistent. Requests are served by a
+# fixed pool of threads instead of one thread per connection.
+workers = 1
+worker_class = 'gthread'
+# Long-polling devices (GET /api/commands/<id>?wait=) hold a thread each while
+# they wait. app.py lets at most COMMAND_WAITERS_MAX (default 4) wait at once,
+# so keep threads above that, raising both together for larger device counts.
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Keep idle HTTP connections from devices and the dashboard open for reuse
+keepalive = 5
+timeout = 60
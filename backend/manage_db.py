@@ -115,6 +115,11 @@ def init_db():
         FOREIGN KEY (plant_id) REFERENCES plants(id)
     )
     ''')
+
+    # Indexes for the zone and profile lookups
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_plants_zone ON plants(zone_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_zone_history_zone_ts ON zone_history(zone_id, timestamp DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_profiles_device_updated ON watering_profiles(device_id, updated_at DESC)')
     
     conn.commit()
     conn.close()
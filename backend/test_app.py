@@ -6,10 +6,20 @@ This script tests the basic functionality of the API endpoints.
 
 import unittest
 import json
+import io
+import hashlib
+import sqlite3
+import gzip
 import os
 import tempfile
 import time
-from app import app, init_db
+import threading
+import collections
+from unittest import mock
+import manage_db
+from app import (app, init_db, control_valve_internal, flush_sensor_readings, cache_put,
+                 unlink_unused_photos, pending_readings, pending_readings_lock,
+                 COMMAND_WAITERS_MAX, UPLOAD_FOLDER)
 
 class IrrigationAPITestCase(unittest.TestCase):
     """Test case for the irrigation API."""
@@ -49,6 +59,89 @@ class IrrigationAPITestCase(unittest.TestCase):
             content_type='application/json'
         )
         self.assertEqual(response.status_code, 400)
+        
+        # Test with several samples in one request
+        now = int(time.time())
+        response = self.client.post(
+            '/api/sensor-data',
+            data=json.dumps({'device_id': 'test_device', 'moisture': [44.0, 45.5],
+                             'raw_adc_value': [31000, 30500], 'timestamps': [now - 60, now]}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        
+        # Test with malformed sample lists: mismatched lengths, missing or
+        # non-numeric timestamps and a scalar ADC value
+        for payload in (
+            {'moisture': [44.0, 45.5], 'raw_adc_value': [31000], 'timestamps': [now - 60, now]},
+            {'moisture': [44.0, 45.5], 'raw_adc_value': [31000, 30500]},
+            {'moisture': [44.0, 45.5], 'timestamps': ['soon', now]},
+            {'moisture': [44.0, 45.5], 'raw_adc_value': 31000, 'timestamps': [now - 60, now]},
+            {'moisture': [44.0], 'timestamps': [1e300]},
+            {'moisture': [44.0, 45.5], 'raw_adc_value': [31000, {'x': 1}], 'timestamps': [now - 60, now]},
+        ):
+            response = self.client.post(
+                '/api/sensor-data',
+                data=json.dumps(dict(payload, device_id='test_device')),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400, payload)
+        
+        # Single readings with a malformed device ID or ADC value are rejected before buffering
+        for payload in (
+            {'device_id': ['test_device'], 'moisture': 40.0},
+            {'device_id': 'test_device', 'moisture': 40.0, 'raw_adc_value': {'x': 1}},
+            {'device_id': 'test_device', 'moisture': 40.0, 'raw_adc_value': '31000'},
+            {'device_id': 'test_device', 'moisture': 'wet'},
+        ):
+            response = self.client.post(
+                '/api/sensor-data',
+                data=json.dumps(payload),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400, payload)
+        
+        # A valid reading is still stored after a rejected one
+        device_id = f'valid_device_{time.time_ns()}'
+        response = self.client.post(
+            '/api/sensor-data',
+            data=json.dumps({'device_id': device_id, 'moisture': 40.0, 'raw_adc_value': 31000}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        flush_sensor_readings()
+        response = self.client.get(f'/api/analytics/moisture?device_id={device_id}&days=1')
+        self.assertEqual([row['raw_adc_value'] for row in json.loads(response.data)], [31000])
+    
+    def test_sensor_data_buffering(self):
+        """Test buffered sensor readings are written on flush and kept when a flush fails."""
+        device_id = f'buffer_device_{time.time_ns()}'
+        
+        # A failed write puts the readings back in the buffer
+        with mock.patch('app.SQL_INSERT_MOISTURE', 'INSERT INTO missing_table VALUES (?, ?, ?, ?)'):
+            response = self.client.post(
+                '/api/sensor-data',
+                data=json.dumps({'device_id': device_id, 'moisture': 41.5, 'raw_adc_value': 32000}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+            with self.assertRaises(sqlite3.OperationalError):
+                flush_sensor_readings()
+        flush_sensor_readings()
+        
+        response = self.client.get(f'/api/analytics/moisture?device_id={device_id}&days=1')
+        data = json.loads(response.data)
+        self.assertEqual([(row['moisture'], row['raw_adc_value']) for row in data], [(41.5, 32000)])
+        
+        # A reading that cannot be bound is dropped without holding back the others
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        with pending_readings_lock:
+            pending_readings.append((device_id, 42.0, {'x': 1}, timestamp))
+            pending_readings.append((device_id, 43.0, 31000, timestamp))
+        flush_sensor_readings()
+        self.assertEqual(len(pending_readings), 0)
+        response = self.client.get(f'/api/analytics/moisture?device_id={device_id}&days=1')
+        self.assertEqual([row['moisture'] for row in json.loads(response.data)], [41.5, 43.0])
     
     def test_commands_endpoint(self):
         """Test the commands endpoint."""
@@ -56,6 +149,35 @@ class IrrigationAPITestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.data)
         self.assertIn('command', data)
+        
+        # Test long-polling picks up a command queued while waiting
+        timer = threading.Timer(0.1, control_valve_internal, ('test_device', 1, True))
+        timer.start()
+        response = self.client.get('/api/commands/test_device?wait=5')
+        timer.join()
+        self.assertEqual(json.loads(response.data)['command'], 'valve:1')
+        
+        # With every waiter slot taken, further polls and other requests are answered at once
+        devices = [f'waiting_device_{i}' for i in range(COMMAND_WAITERS_MAX)]
+        waiters = [threading.Thread(target=app.test_client().get, args=(f'/api/commands/{device}?wait=5',))
+                   for device in devices]
+        for waiter in waiters:
+            waiter.start()
+        time.sleep(0.2)
+        started = time.monotonic()
+        response = self.client.get('/api/commands/test_device?wait=5')
+        self.assertIsNone(json.loads(response.data)['command'])
+        response = self.client.post(
+            '/api/sensor-data',
+            data=json.dumps({'device_id': 'test_device', 'moisture': 45.5}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - started, 1)
+        for device in devices:
+            control_valve_internal(device, 0, True)
+        for waiter in waiters:
+            waiter.join()
     
     def test_valve_control_endpoint(self):
         """Test the valve control endpoint."""
@@ -104,11 +226,74 @@ class IrrigationAPITestCase(unittest.TestCase):
         data = json.loads(response.data)
         self.assertIsInstance(data, list)
         
+        # Test downsampled moisture analytics
+        response = self.client.get('/api/analytics/moisture?device_id=test_device&days=1&bucket=hour')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertIsInstance(data, list)
+        
+        response = self.client.get('/api/analytics/moisture?device_id=test_device&bucket=week')
+        self.assertEqual(response.status_code, 400)
+        
+        # Paging by (timestamp, id) returns readings that share a second exactly once
+        device_id = f'paging_device_{time.time_ns()}'
+        now = int(time.time())
+        self.client.post(
+            '/api/sensor-data',
+            data=json.dumps({'device_id': device_id, 'moisture': [40.0, 41.0, 42.0, 43.0],
+                             'timestamps': [now - 1, now - 1, now - 1, now]}),
+            content_type='application/json'
+        )
+        flush_sensor_readings()
+        seen = []
+        url = f'/api/analytics/moisture?device_id={device_id}&limit=2'
+        while True:
+            page = json.loads(self.client.get(url).data)
+            if not page:
+                break
+            seen = [row['moisture'] for row in page] + seen
+            url = (f'/api/analytics/moisture?device_id={device_id}&limit=2'
+                   f"&before={page[0]['timestamp']}&before_id={page[0]['id']}")
+        self.assertEqual(seen, [40.0, 41.0, 42.0, 43.0])
+        
         # Test valve history
         response = self.client.get('/api/analytics/valve?device_id=test_device&days=1')
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.data)
-        self.assertIsInstance(data, list)
+        self.assertIsInstance(data['data'], list)
+        self.assertIn('pagination', data)
+        
+        # Large JSON bodies are gzipped for clients that accept it
+        for state in (0, 1) * 10:
+            control_valve_internal('test_device', state, is_manual=True)
+        response = self.client.get('/api/analytics/valve?device_id=test_device&days=1',
+                                   headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers.get('Content-Encoding'), 'gzip')
+        data = json.loads(gzip.decompress(response.data))
+        self.assertGreaterEqual(len(data['data']), 20)
+    
+    def test_measurements_batch_endpoint(self):
+        """Test the batch measurements endpoint."""
+        response = self.client.post(
+            '/api/measurements/batch',
+            data=json.dumps([
+                {'device_id': 'test_device', 'height': 10.0},
+                {'device_id': 'test_device', 'height': 10.5, 'notes': 'batch'}
+            ]),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['inserted'], 2)
+        
+        # Test with a measurement missing its device ID
+        response = self.client.post(
+            '/api/measurements/batch',
+            data=json.dumps([{'height': 10.0}]),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
     
     def test_automation_endpoints(self):
         """Test the automation endpoints."""
@@ -140,6 +325,80 @@ class IrrigationAPITestCase(unittest.TestCase):
         data = json.loads(response.data)
         self.assertEqual(data['low_threshold'], 20.0)
         self.assertEqual(data['high_threshold'], 80.0)
+    
+    def test_photo_uploads(self):
+        """Test photo uploads are stored by content hash, shared between identical uploads and cleaned up."""
+        response = self.client.post(
+            '/api/measurements',
+            data=json.dumps({'device_id': 'test_device', 'plant_name': 'photo_plant', 'height': 10.0}),
+            content_type='application/json'
+        )
+        measurement_id = json.loads(response.data)['id']
+        photos_url = f'/api/measurements/{measurement_id}/photos'
+        before = set(os.listdir(UPLOAD_FOLDER))
+        content = os.urandom(4096)
+        filename = hashlib.sha256(content).hexdigest() + '.jpg'
+        
+        response = self.client.post(photos_url, data={'photo': (io.BytesIO(content), 'leaf.JPG')})
+        self.assertEqual(response.status_code, 200)
+        first_id = json.loads(response.data)['id']
+        self.assertEqual(json.loads(response.data)['filename'], filename)
+        response = self.client.get(f'/api/photos/{first_id}')
+        self.assertEqual(response.data, content)
+        response.close()
+        self.assertEqual(len(json.loads(self.client.get(photos_url).data)), 1)
+        
+        # An identical upload reuses the stored file
+        response = self.client.post(photos_url, data={'photo': (io.BytesIO(content), 'again.jpg')})
+        self.assertEqual(json.loads(response.data)['filename'], filename)
+        second_id = json.loads(response.data)['id']
+        self.assertEqual(len(json.loads(self.client.get(photos_url).data)), 2)
+        
+        # A rejected upload leaves no spooled file behind
+        response = self.client.post(photos_url, data={'photo': (io.BytesIO(content), 'leaf.gif')})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(os.listdir(UPLOAD_FOLDER)) - before, {filename})
+        
+        # The shared file is unlinked only once no photo refers to it
+        with mock.patch('app.remove_photo_files', unlink_unused_photos):
+            self.client.delete(f'/api/photos/{first_id}')
+            self.assertTrue(os.path.exists(os.path.join(UPLOAD_FOLDER, filename)))
+            self.client.delete(f'/api/photos/{second_id}')
+            self.assertFalse(os.path.exists(os.path.join(UPLOAD_FOLDER, filename)))
+        self.assertEqual(json.loads(self.client.get(photos_url).data), [])
+    
+    def test_response_caches(self):
+        """Test writes invalidate the cached zone and profile listings and the caches stay bounded."""
+        # Zones and profiles live in the tables manage_db.py creates
+        manage_db.init_db()
+        
+        zone_count = len(json.loads(self.client.get('/api/zones').data))
+        response = self.client.post(
+            '/api/zones',
+            data=json.dumps({'name': 'Cache zone', 'width': 1, 'length': 2}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(json.loads(self.client.get('/api/zones').data)), zone_count + 1)
+        
+        device_id = f'cache_device_{time.time_ns()}'
+        response = self.client.get(f'/api/profiles?device_id={device_id}')
+        self.assertEqual(json.loads(response.data)[0]['name'], 'Default')
+        response = self.client.post(
+            '/api/profiles',
+            data=json.dumps({'device_id': device_id, 'name': 'Cached', 'is_default': 1}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get(f'/api/profiles?device_id={device_id}')
+        self.assertEqual([profile['name'] for profile in json.loads(response.data)], ['Cached'])
+        
+        # A full cache drops its oldest entry
+        cache = collections.OrderedDict()
+        with mock.patch('app.RESPONSE_CACHE_SIZE', 2):
+            for key in range(3):
+                cache_put(cache, key, [key])
+        self.assertEqual(list(cache), [1, 2])
 
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
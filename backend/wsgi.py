@@ -0,0 +1,10 @@
+"""
+WSGI entry point for the irrigation control system API.
+Run from the backend directory with: gunicorn wsgi:app
+"""
+
+from app import app, start_background_workers
+
+# Start the scheduler and sensor flusher as soon as the app is loaded
+# instead of waiting for the first request
+start_background_workers()
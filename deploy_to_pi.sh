@@ -15,6 +15,8 @@ ssh $PI_HOST "mkdir -p $REMOTE_DIR"
 # Copy backend files
 echo "Copying backend files..."
 scp $BACKEND_DIR/app.py $PI_HOST:$REMOTE_DIR/
+scp $BACKEND_DIR/wsgi.py $PI_HOST:$REMOTE_DIR/
+scp $BACKEND_DIR/gunicorn.conf.py $PI_HOST:$REMOTE_DIR/
 scp $BACKEND_DIR/manage_db.py $PI_HOST:$REMOTE_DIR/
 scp $BACKEND_DIR/requirements.txt $PI_HOST:$REMOTE_DIR/
 scp $BACKEND_DIR/pico-irrigator-backend.service $PI_HOST:$REMOTE_DIR/